@@ -0,0 +1,29 @@
+"""
+Import time of pyspdf
+
+Prints the time of `import pyspdf` in fresh interpreters and whether gtk
+was imported by it, compared with the time of `import gtk` alone.
+
+    python benchmark_import.py [runs]
+"""
+import sys
+import subprocess
+
+def measure(statement, runs):
+    code = ("import sys, time; sys.path.append('../'); " +
+        "start = time.time(); {}; ".format(statement) +
+        "print(time.time() - start); print('gtk' in sys.modules)")
+    durations = []
+    for i in range(runs):
+        out = subprocess.check_output([sys.executable, "-c", code])
+        duration, gtk_loaded = out.split()
+        durations.append(float(duration))
+    return min(durations), gtk_loaded == "True"
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for statement in ["import pyspdf", "import gtk"]:
+        duration, gtk_loaded = measure(statement, runs)
+        print("{}: {:.1f} ms (gtk imported: {})".format(statement,
+            duration*1000, gtk_loaded))
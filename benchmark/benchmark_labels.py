@@ -0,0 +1,48 @@
+"""
+Drawing speed of many short texts
+
+Prints the number of labels drawn per second with individual `Text` items
+and with a single `Labels` item.
+    
+    python benchmark_labels.py [labels]
+"""
+import sys
+sys.path.append("../")
+import time
+import pyspdf as pdf
+
+class BenchmarkPDF(pdf.PDF):
+    
+    def __init__(self, count, bulk):
+        pdf.PDF.__init__(self)
+        self.count = count
+        self.bulk = bulk
+        self.fmt = pdf.TextFormat(size=8)
+        self.labels = []
+        for i in range(self.count):
+            self.labels.append(("Label {}".format(i), 10+(i%3)*60,
+                10+(i/3)%25*10))
+        self.duration = 0
+    
+    
+    def _paginate(self, op, ctx):
+        self._set_page_count(1)
+    
+    
+    def _draw_page(self, op, ctx, no):
+        start = time.time()
+        if self.bulk:
+            pdf.Labels(ctx, self.labels, self.fmt).draw(0, 0)
+        else:
+            for text, x, y in self.labels:
+                pdf.Text(ctx, text, self.fmt).draw(x, y)
+        self.duration = time.time() - start
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for bulk in [False, True]:
+        benchmark = BenchmarkPDF(count, bulk)
+        benchmark.save_to_file("/dev/null")
+        print("{}: {:.0f} labels per second".format(
+            "Labels" if bulk else "Text", count/benchmark.duration))
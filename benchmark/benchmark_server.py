@@ -0,0 +1,109 @@
+"""
+Throughput and latency of the render server
+
+Renders a one-page invoice via a `RenderServer` with warm workers and via
+a new Python process per document, and prints documents per second and
+the mean and 95th percentile latency of both.
+
+    python benchmark_server.py [documents] [processes]
+"""
+import sys
+sys.path.append("../")
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import pyspdf as pdf
+from pyspdf import server
+
+SOCKET = os.path.join(tempfile.gettempdir(), "pyspdf_benchmark.sock")
+
+class InvoicePDF(pdf.PDF):
+    
+    def __init__(self, data):
+        pdf.PDF.__init__(self, backend="cairo")
+        self.data = data
+        self.table = None
+    
+    
+    def _paginate(self, op, ctx):
+        fmt = pdf.TableFormat(["item", "price"])
+        fmt.set_col_width("equal")
+        self.table = pdf.Table(ctx, fmt, data_h=[{"item": "Item",
+            "price": "Price"}], data_b=self.data["items"])
+        self._set_page_count(1)
+    
+    
+    def _draw_page(self, op, ctx, no):
+        pdf.Text(ctx, "Invoice {}".format(self.data["no"]),
+            pdf.TextFormat(size=20)).draw(10, 10)
+        self.table.draw(10, 30)
+
+server.register("invoice", InvoicePDF)
+
+
+def create_data(i):
+    return {"no": i, "items": [{"item": "Item {}".format(j),
+        "price": "{:.2f}".format(j*1.5)} for j in range(20)]}
+
+
+def per_process(count):
+    code = ("import sys; sys.path.append('.'); " +
+        "import benchmark_server as b; " +
+        "b.InvoicePDF(b.create_data({})).render_to_bytes()")
+    latencies = []
+    for i in range(count):
+        start = time.time()
+        subprocess.check_call([sys.executable, "-c", code.format(i)])
+        latencies.append(time.time() - start)
+    return latencies
+
+
+def via_server(count, processes):
+    latencies = []
+    def run(jobs):
+        client = server.RenderClient(SOCKET)
+        for i in jobs:
+            start = time.time()
+            client.render("invoice", create_data(i))
+            latencies.append(time.time() - start)
+        client.close()
+    threads = [threading.Thread(target=run, args=(range(i, count,
+        processes),)) for i in range(processes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def report(name, latencies, duration):
+    latencies = sorted(latencies)
+    print("{}: {:.1f} documents per second, latency mean {:.1f} ms, " \
+        "p95 {:.1f} ms".format(name, len(latencies)/duration,
+        sum(latencies)/len(latencies)*1000,
+        latencies[int(0.95*(len(latencies)-1))]*1000))
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    
+    start = time.time()
+    latencies = per_process(count)
+    report("process per document", latencies, time.time() - start)
+    
+    render_server = server.RenderServer(SOCKET, processes,
+        fonts=[pdf.TextFormat(size=10), pdf.TextFormat(size=20)])
+    thread = threading.Thread(target=render_server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        via_server(processes, processes)
+        start = time.time()
+        latencies = via_server(count, processes)
+        report("render server", latencies, time.time() - start)
+    finally:
+        render_server.shutdown()
+        render_server.close()
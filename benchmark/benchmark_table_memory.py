@@ -0,0 +1,63 @@
+"""
+Memory usage of large tables
+
+Prints the number of bytes per table cell for eager and lazy cells. The
+eager mode does not pass the `lazy` argument, so it also runs on versions of
+pyspdf without lazy cells, e.g. to compare 1M cells before and after:
+    
+    python benchmark_table_memory.py [rows] [eager|lazy]
+"""
+import sys
+sys.path.append("../")
+import multiprocessing
+import resource
+import pyspdf as pdf
+
+class BenchmarkPDF(pdf.PDF):
+    
+    def __init__(self, rows, lazy):
+        pdf.PDF.__init__(self)
+        self.rows = rows
+        self.lazy = lazy
+        self.cols = ["id", "date", "amount", "currency"]
+        self.table_fmt = pdf.TableFormat(self.cols)
+        self.table_fmt.set_col_width("equal")
+        self.table_fmt.set_fmt(pdf.TextFormat(size=8))
+        self.bytes_per_cell = 0
+    
+    
+    def _paginate(self, op, ctx):
+        data = []
+        for i in range(self.rows):
+            data.append({"id":str(i), "date":"2017-01-{:02d}".format(i%28+1),
+                "amount":"{:.2f}".format(i*0.37), "currency":"EUR"})
+        
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        kwargs = {"lazy": True} if self.lazy else {}
+        self.table = pdf.Table(ctx, self.table_fmt, data_b=data, **kwargs)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+        self.bytes_per_cell = rss*1024./(self.rows*len(self.cols))
+        self._set_page_count(1)
+    
+    
+    def _draw_page(self, op, ctx, no):
+        pass
+
+
+def run(rows, lazy, queue):
+    benchmark = BenchmarkPDF(rows, lazy)
+    benchmark.save_to_file("/dev/null")
+    queue.put(benchmark.bytes_per_cell)
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 250000
+    modes = sys.argv[2:] or ["eager", "lazy"]
+    for lazy in [mode == "lazy" for mode in modes]:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run, args=(rows, lazy, queue))
+        process.start()
+        bytes_per_cell = queue.get()
+        process.join()
+        print("{} cells, lazy={}: {:.0f} bytes per cell".format(
+            rows*4, lazy, bytes_per_cell))
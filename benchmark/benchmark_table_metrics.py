@@ -0,0 +1,67 @@
+"""
+Construction time of large numeric tables
+
+Prints the time to create a table with and without the glyph advance fast
+path (`Table(..., metrics=True)`) and checks the estimated cell sizes
+against the sizes of laid out texts. Fails if an estimated width is smaller
+than the laid out width, as such cells could wrap when they are drawn.
+    
+    python benchmark_table_metrics.py [rows]
+"""
+import sys
+sys.path.append("../")
+import random
+import time
+import pango
+import pyspdf as pdf
+
+class BenchmarkPDF(pdf.PDF):
+    
+    def __init__(self, rows):
+        pdf.PDF.__init__(self)
+        self.cols = ["account", "debit", "credit", "balance"]
+        self.data = []
+        for i in range(rows):
+            row = {"account":"{:08d}".format(random.randint(0, 1e8))}
+            for col in self.cols[1:]:
+                row[col] = "{:,.2f} EUR".format(random.uniform(-1e6, 1e6))
+            self.data.append(row)
+        self.table_fmt = pdf.TableFormat(self.cols)
+        self.table_fmt.set_width("fixed", self.w-20)
+        self.table_fmt.set_fmt(pdf.TextFormat(size=8))
+        self.table_fmt.set_fmt_col("balance", "align", pango.ALIGN_RIGHT)
+    
+    
+    def _paginate(self, op, ctx):
+        for metrics in [False, True]:
+            start = time.time()
+            pdf.Table(ctx, self.table_fmt, data_b=self.data, metrics=metrics)
+            print("metrics={}: {:.2f}s for {} cells".format(metrics,
+                time.time()-start, len(self.data)*len(self.cols)))
+        
+        # compare estimation with laid out texts
+        fmt = pdf.TextFormat(size=8)
+        metrics = pdf.TextMetrics.get(ctx, fmt)
+        w_diff_max = 0
+        h_diff_max = 0
+        for row in self.data[:1000]:
+            for col in self.cols:
+                text = pdf.Text(ctx, row[col], fmt)
+                w, h = metrics.estimate(row[col])
+                assert w >= text.w, "estimated width {} of {!r} is " \
+                    "smaller than laid out width {}".format(w, row[col],
+                    text.w)
+                w_diff_max = max(w_diff_max, abs(text.w-w))
+                h_diff_max = max(h_diff_max, abs(text.h-h))
+        print("maximum deviation of estimation: w={} h={}".format(
+            w_diff_max, h_diff_max))
+        self._set_page_count(1)
+    
+    
+    def _draw_page(self, op, ctx, no):
+        pass
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    BenchmarkPDF(rows).save_to_file("/dev/null")
@@ -0,0 +1,46 @@
+"""
+First layout time with cold and warm font map
+
+Prints the time of the first text layout in a fresh process without
+warm-up and after `warm_up()`, and the duration of the warm-up itself.
+
+    python benchmark_warm_up.py [font] [runs]
+"""
+import sys
+import subprocess
+
+CODE = """
+import sys
+sys.path.append("../")
+import time
+import pyspdf as pdf
+fmt = pdf.TextFormat(font={font!r}, size=10)
+start = time.time()
+if {warm}:
+    pdf.warm_up([fmt])
+warm_up = time.time() - start
+ctx = pdf.RenderContext()
+start = time.time()
+pdf.Text(ctx, "The first text of the document", fmt)
+print("{{}} {{}}".format(warm_up, time.time() - start))
+"""
+
+def measure(font, warm, runs):
+    warm_ups = []
+    layouts = []
+    for i in range(runs):
+        out = subprocess.check_output([sys.executable, "-c",
+            CODE.format(font=font, warm=warm)])
+        warm_up, layout = out.split()
+        warm_ups.append(float(warm_up))
+        layouts.append(float(layout))
+    return min(warm_ups), min(layouts)
+
+
+if __name__ == "__main__":
+    font = sys.argv[1] if len(sys.argv) > 1 else "CMU Sans Serif"
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    for warm in [False, True]:
+        warm_up, layout = measure(font, warm, runs)
+        print("{}: warm-up {:.1f} ms, first layout {:.1f} ms".format(
+            "warm" if warm else "cold", warm_up*1000, layout*1000))
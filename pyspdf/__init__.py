@@ -16,12 +16,35 @@
 
 """a small and simple pdf renderer based on pygtk"""
 from .error import RenderError
-from .pdf import PDF
-from .line import LineFormat, Line
-from .text import TextFormat, Text
+from .cache import LRUCache, RenderCache
+from .context import RenderContext, warm_up
+from .counters import Budget
+from .tracing import Tracer, start_trace, stop_trace
+from .pdf import PDF, Progress, UNIT_PIXEL, UNIT_POINTS, UNIT_INCH, \
+    UNIT_MM, PAPER_NAME_A3, PAPER_NAME_A4, PAPER_NAME_A5, PAPER_NAME_B5, \
+    PAPER_NAME_LETTER, PAPER_NAME_EXECUTIVE, PAPER_NAME_LEGAL, \
+    PAGE_ORIENTATION_PORTRAIT, PAGE_ORIENTATION_LANDSCAPE, \
+    PAGE_ORIENTATION_REVERSE_PORTRAIT, PAGE_ORIENTATION_REVERSE_LANDSCAPE
+from .line import LineFormat, Line, Polyline, Scatter, Bars
+from .text import TextFormat, Text, TextMetrics, TextLines, TextBlock, \
+    Labels, DeferredText, TextStream
 from .image import ImageFormat, Image
 from .table import TableFormat, Table
+from .store import PageStore
+from .server import RenderServer, RenderClient
+from .story import Frame, PageTemplate, Spacer, PageBreak, KeepTogether, \
+    StoryPDF
 
 __version__ = "1.0.0"
-__all__ = ["RenderError", "PDF", "LineFormat", "Line", "TextFormat", "Text",
-    "ImageFormat", "Image", "TableFormat", "Table"]
+__all__ = ["RenderError", "LRUCache", "RenderCache", "RenderContext",
+    "warm_up", "Budget", "Tracer", "start_trace", "stop_trace", "PDF",
+    "Progress", "UNIT_PIXEL", "UNIT_POINTS", "UNIT_INCH", "UNIT_MM",
+    "PAPER_NAME_A3", "PAPER_NAME_A4", "PAPER_NAME_A5", "PAPER_NAME_B5",
+    "PAPER_NAME_LETTER", "PAPER_NAME_EXECUTIVE", "PAPER_NAME_LEGAL",
+    "PAGE_ORIENTATION_PORTRAIT", "PAGE_ORIENTATION_LANDSCAPE",
+    "PAGE_ORIENTATION_REVERSE_PORTRAIT", "PAGE_ORIENTATION_REVERSE_LANDSCAPE",
+    "LineFormat", "Line", "Polyline", "Scatter", "Bars", "TextFormat", "Text",
+    "TextMetrics", "TextLines", "TextBlock", "Labels", "DeferredText",
+    "TextStream", "ImageFormat", "Image", "TableFormat", "Table", "PageStore",
+    "RenderServer", "RenderClient", "Frame", "PageTemplate", "Spacer",
+    "PageBreak", "KeepTogether", "StoryPDF"]
@@ -0,0 +1,239 @@
+# pyspdf - a small and simple pdf renderer based on pygtk
+# Copyright (C) 2017 Lukas Schwarz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import hashlib
+import os
+import shutil
+import tempfile
+
+class LRUCache:
+    """
+    Small in-memory cache which discards the least recently used entries
+    """
+    
+    def __init__(self, size=32):
+        """
+        Parameters
+        ----------
+        size : int
+            Maximum number of entries. A size of 0 disables the cache
+        """
+        self.size = size
+        self.entries = collections.OrderedDict()
+    
+    
+    def get(self, key, default=None):
+        """
+        Return cached value of `key` and mark it as recently used
+        
+        Parameters
+        ----------
+        key : hashable
+        default : value returned if `key` is not cached
+        """
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            return default
+        self.entries[key] = value
+        return value
+    
+    
+    def put(self, key, value):
+        """
+        Add `value` to cache and discard least recently used entries if the
+        cache is full
+        
+        Parameters
+        ----------
+        key : hashable
+        value : mixed
+        """
+        if self.size <= 0:
+            return
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+    
+    
+    def clear(self):
+        """
+        Remove all entries
+        """
+        self.entries.clear()
+    
+    
+    def __len__(self):
+        return len(self.entries)
+
+
+
+class RenderCache:
+    """
+    Content addressed on-disk cache of rendered pdf files. Documents are
+    identified by a key derived from `PDF._cache_key()`. If the cache grows
+    beyond its maximum size, the least recently used files are removed
+    """
+    
+    def __init__(self, directory, max_size=100*1024*1024, link=True):
+        """
+        Parameters
+        ----------
+        directory : string
+            Directory of cached files, is created if required
+        max_size : int
+            Maximum total size of cached files in bytes
+        link : bool
+            Whether cache hits are hardlinked to the output file instead of
+            copied. Hardlinked output files must not be modified in place
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.link = link
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+    
+    
+    def key(self, data):
+        """
+        Return key of given content
+        
+        Parameters
+        ----------
+        data : mixed
+            Deterministic representation of the content, e.g. a tuple of
+            strings and numbers
+        """
+        return hashlib.sha1(repr(data)).hexdigest()
+    
+    
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pdf")
+    
+    
+    def get(self, key, filename):
+        """
+        Write cached file of `key` to `filename`. Returns whether the key was
+        found
+        
+        Parameters
+        ----------
+        key : string
+        filename : string
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return False
+        os.utime(path, None)
+        if os.path.lexists(filename):
+            os.remove(filename)
+        if self.link:
+            try:
+                os.link(path, filename)
+                return True
+            except OSError:
+                pass
+        shutil.copyfile(path, filename)
+        return True
+    
+    
+    def get_path(self, key):
+        """
+        Return path of cached file of `key` or None if not found
+        
+        Parameters
+        ----------
+        key : string
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        os.utime(path, None)
+        return path
+    
+    
+    def get_bytes(self, key):
+        """
+        Return content of cached file of `key` or None if not found
+        
+        Parameters
+        ----------
+        key : string
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        os.utime(path, None)
+        with open(path, "rb") as fh:
+            return fh.read()
+    
+    
+    def put(self, key, filename, evict=True):
+        """
+        Add file `filename` to cache
+        
+        Parameters
+        ----------
+        key : string
+        filename : string
+        evict : bool
+            Whether to remove least recently used files afterwards. Can be
+            disabled if paths of cached files are still in use
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        os.close(fd)
+        shutil.copyfile(filename, tmp)
+        os.rename(tmp, self._path(key))
+        if evict:
+            self.evict()
+    
+    
+    def put_bytes(self, key, data):
+        """
+        Add content `data` to cache
+        
+        Parameters
+        ----------
+        key : string
+        data : string
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.rename(tmp, self._path(key))
+        self.evict()
+    
+    
+    def evict(self):
+        """
+        Remove least recently used files until the total size is less than
+        the maximum size
+        """
+        files = []
+        size = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pdf"):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            files.append((stat.st_mtime, stat.st_size, name))
+            size += stat.st_size
+        files.sort()
+        while size > self.max_size and files:
+            mtime, file_size, name = files.pop(0)
+            os.remove(os.path.join(self.directory, name))
+            size -= file_size
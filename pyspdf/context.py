@@ -0,0 +1,285 @@
+# pyspdf - a small and simple pdf renderer based on pygtk
+# Copyright (C) 2017 Lukas Schwarz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import cairo
+import pango
+import pangocairo
+
+# text used to load fonts and their glyphs during warm-up
+WARM_UP_TEXT = "".join(chr(c) for c in range(32, 127))
+
+# pango contexts shared by all render contexts of this process, indexed by
+# units per inch
+_pango_contexts = {}
+
+# calls of a cairo context, which only query its state. A `Fingerprint`
+# passes them to its cairo context without recording them
+_QUERIES = frozenset(["user_to_device", "user_to_device_distance",
+    "device_to_user", "device_to_user_distance", "copy_path",
+    "copy_path_flat", "copy_clip_rectangle_list", "create_layout"])
+
+# calls of a cairo context, which only paint and do not change the state
+# queried afterwards. A `Fingerprint` records them without passing them to
+# its cairo context
+_PAINTS = frozenset(["show_layout", "show_layout_line", "show_page",
+    "copy_page", "paint", "paint_with_alpha", "mask", "mask_surface",
+    "set_source", "set_source_pixbuf", "set_source_surface", "show_text",
+    "show_glyphs", "update_layout", "update_context"])
+
+class RenderContext(object):
+    """
+    Replacement of gtk.PrintContext based only on cairo and pangocairo. It
+    can be used for measuring and drawing items without gtk, e.g. in worker
+    processes. Layouts are created in the same way as by gtk.PrintContext, so
+    measurements are identical for the same resolution
+    """
+    
+    def __init__(self, units_per_inch=72., dpi=72., surface=None):
+        """
+        Parameters
+        ----------
+        units_per_inch : float
+            Size of the user unit, e.g. 25.4 for mm, 72 for points
+        dpi : float
+            Resolution of the target surface in device units per inch, 72 for
+            PDF surfaces
+        surface : None, cairo.Surface
+            Target surface. If None, a dummy surface is used, which is
+            sufficient for measuring
+        """
+        self.units_per_inch = units_per_inch
+        self.dpi = dpi
+        self.surface = None
+        self.cctx = None
+        self.deferred = None
+        self.pango_ctx = get_pango_context(units_per_inch)
+        self.set_surface(surface)
+    
+    
+    def set_surface(self, surface, dpi=None):
+        """
+        Set target surface of drawing operations
+        
+        Parameters
+        ----------
+        surface : None, cairo.Surface
+        dpi : None, float
+            New resolution of the target surface. Layouts are measured in
+            user units and are not affected by the resolution
+        """
+        if dpi:
+            self.dpi = dpi
+        if surface == None:
+            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1)
+        self.surface = surface
+        self.cctx = pangocairo.CairoContext(cairo.Context(surface))
+        self.cctx.scale(self.dpi/self.units_per_inch,
+            self.dpi/self.units_per_inch)
+        self.cctx.update_context(self.pango_ctx)
+    
+    
+    def set_cairo_context(self, cctx):
+        """
+        Set context receiving the drawing operations instead of the context
+        of the target surface, e.g. a `Fingerprint`. Setting a surface
+        afterwards restores a cairo context
+        
+        Parameters
+        ----------
+        cctx : pangocairo.CairoContext, Fingerprint
+        """
+        self.cctx = cctx
+    
+    
+    def get_cairo_context(self):
+        """
+        Return cairo context of target surface
+        """
+        return self.cctx
+    
+    
+    def create_pango_layout(self):
+        """
+        Return new pango layout
+        """
+        return pango.Layout(self.pango_ctx)
+    
+    
+    def get_dpi_x(self):
+        return self.dpi
+    
+    
+    def get_dpi_y(self):
+        return self.dpi
+
+
+class Fingerprint(object):
+    """
+    Replacement of a cairo context, which does not draw but records all
+    drawing operations with their arguments into a hash. Pango layouts are
+    recorded by their text, attributes and properties. Queries, e.g.
+    `get_current_point()`, are answered by a cairo context, which receives
+    all operations changing its state but does not paint
+    """
+    
+    def __init__(self, cctx):
+        """
+        Parameters
+        ----------
+        cctx : pangocairo.CairoContext
+            Context answering queries, e.g. of a `RenderContext` with a dummy
+            surface
+        """
+        self.cctx = cctx
+        self.hash = hashlib.sha1()
+        self.stable = True
+    
+    
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if name in _QUERIES or name.startswith(("get_", "has_", "in_")) or \
+                name.endswith("_extents"):
+            return getattr(self.cctx, name)
+        
+        def record(*args):
+            self.hash.update(name)
+            for arg in args:
+                try:
+                    self.hash.update(_fingerprint(arg))
+                except TypeError:
+                    self.stable = False
+            if name in ("fill", "stroke"):
+                # only the path is consumed
+                self.cctx.new_path()
+            elif name not in _PAINTS:
+                return getattr(self.cctx, name)(*args)
+        return record
+    
+    
+    def hexdigest(self):
+        """
+        Return hash of recorded operations or None if an argument could not
+        be recorded
+        """
+        if not self.stable:
+            return None
+        return self.hash.hexdigest()
+
+
+def _fingerprint(obj):
+    """
+    Return deterministic string representation of argument of a drawing
+    operation. Raises TypeError for objects without such a representation,
+    e.g. surfaces
+    """
+    if isinstance(obj, pango.Layout):
+        attrs = []
+        it = obj.get_attributes().get_iterator()
+        while True:
+            for attr in it.get_attrs():
+                attrs.append((attr.type, attr.start_index, attr.end_index,
+                    [str(getattr(attr, k)) for k in ("value", "color", "desc")
+                        if hasattr(attr, k)]))
+            if not it.next():
+                break
+        return repr(("layout", obj.get_text(),
+            obj.get_font_description().to_string(), obj.get_width(),
+            obj.get_alignment(), obj.get_justify(), obj.get_spacing(),
+            obj.get_wrap(), attrs))
+    if isinstance(obj, pango.LayoutLine):
+        return repr(("line", _fingerprint(obj.layout), obj.start_index,
+            obj.length))
+    if isinstance(obj, (list, tuple)):
+        return repr([_fingerprint(o) for o in obj])
+    if hasattr(obj, "get_pixels"):
+        # pixbuf
+        return repr(("pixbuf", obj.get_width(), obj.get_height(),
+            hashlib.sha1(obj.get_pixels()).hexdigest()))
+    if isinstance(obj, cairo.Matrix):
+        return repr(("matrix", tuple(obj)))
+    if isinstance(obj, cairo.SolidPattern):
+        return repr(("solid", obj.get_rgba()))
+    if isinstance(obj, (int, long, float, basestring, bool)) or obj == None:
+        return repr(obj)
+    raise TypeError("Can not fingerprint {!r}".format(obj))
+
+
+def get_pango_context(units_per_inch=72.):
+    """
+    Return pango context of this process for the given unit size. The
+    context is created on first use and shared by all render contexts, it
+    uses the default font map of the process, which caches loaded fonts
+    
+    Parameters
+    ----------
+    units_per_inch : float
+    """
+    pango_ctx = _pango_contexts.get(units_per_inch)
+    if pango_ctx == None:
+        # see gtk_print_context_create_pango_context()
+        pango_ctx = pangocairo.cairo_font_map_get_default().create_context()
+        options = cairo.FontOptions()
+        options.set_hint_metrics(cairo.HINT_METRICS_OFF)
+        pangocairo.context_set_font_options(pango_ctx, options)
+        pangocairo.context_set_resolution(pango_ctx, units_per_inch)
+        _pango_contexts[units_per_inch] = pango_ctx
+    return pango_ctx
+
+
+def warm_up(fonts, units_per_inch=72.):
+    """
+    Load fonts into the default font map of this process, so the first
+    layout of a text with these fonts does not pay for font discovery and
+    loading. The font map is shared with gtk.PrintContext. Call this method
+    at the start of long running processes or before forking workers
+    
+    Parameters
+    ----------
+    fonts : list<string, pango.FontDescription, TextFormat>
+        Font descriptions, e.g. "CMU Sans Serif 10", or text formats
+    units_per_inch : float
+        Size of the user unit of the shared pango context to initialize
+    """
+    pango_ctx = get_pango_context(units_per_inch)
+    for font in fonts:
+        if hasattr(font, "font_descr"):
+            # TextFormat
+            if font.font_descr:
+                font = font.font_descr
+            else:
+                font = "{} {} {}".format(font.font, font.style, font.size)
+        if not isinstance(font, pango.FontDescription):
+            font = pango.FontDescription(font)
+        layout = pango.Layout(pango_ctx)
+        layout.set_font_description(font)
+        layout.set_text(WARM_UP_TEXT)
+        layout.get_pixel_size()
+
+
+def get_resolution(ctx):
+    """
+    Return tuple (units_per_inch, dpi) of print context, which can be used
+    to create a `RenderContext` with identical measurements
+    
+    Parameters
+    ----------
+    ctx : gtk.PrintContext, RenderContext
+    """
+    dpi = ctx.get_dpi_y()
+    pixels_per_unit = ctx.get_cairo_context().user_to_device_distance(0, 1)[1]
+    return dpi/pixels_per_unit, dpi
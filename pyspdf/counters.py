@@ -0,0 +1,87 @@
+# pyspdf - a small and simple pdf renderer based on pygtk
+# Copyright (C) 2017 Lukas Schwarz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# number of expensive operations in this process since start or `reset()`
+# layouts: pango layouts created
+# markup_parses: texts parsed with the pango markup parser
+# saves: cairo save/restore pairs of items
+# strokes: cairo strokes
+# fills: cairo fills
+# pixbuf_decodes: decoded image files
+counts = {
+    "layouts": 0,
+    "markup_parses": 0,
+    "saves": 0,
+    "strokes": 0,
+    "fills": 0,
+    "pixbuf_decodes": 0,
+}
+
+def reset():
+    """
+    Set all counters to 0
+    """
+    for k in counts:
+        counts[k] = 0
+
+
+def snapshot():
+    """
+    Return copy of current counts
+    """
+    return dict(counts)
+
+
+class Budget(object):
+    """
+    Context manager asserting that the operations within its block do not
+    exceed given maximum counts, e.g. in tests:
+        
+        with Budget(layouts=100):
+            text.split(max_height=[100., 200.])
+    
+    Only operations of the current process are counted
+    """
+    
+    def __init__(self, **limits):
+        """
+        Parameters
+        ----------
+        limits : int
+            Maximum count of each counter, e.g. `layouts=100`
+        """
+        for k in limits:
+            if k not in counts:
+                raise ValueError("Unknown counter {}".format(k))
+        self.limits = limits
+        self.start = None
+        self.used = {}
+    
+    
+    def __enter__(self):
+        self.start = snapshot()
+        return self
+    
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        self.used = {k: counts[k] - self.start[k] for k in counts}
+        if exc_type != None:
+            return False
+        exceeded = ["{} {} > {}".format(k, self.used[k], v)
+            for k, v in sorted(self.limits.items()) if self.used[k] > v]
+        if exceeded:
+            raise AssertionError("Budget exceeded: " + ", ".join(exceeded))
+        return False
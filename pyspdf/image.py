@@ -14,13 +14,18 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import gtk
+import os
 from error import RenderError
+from cache import LRUCache
+from counters import counts
+from tracing import span
 
-class ImageFormat:
+class ImageFormat(object):
     """
     Definition of image format
     """
+    __slots__ = ("width", "height", "center", "dots_per_unit")
+    
     def __init__(self, width, height, center=False, dots_per_unit=20):
         """
         Parameters
@@ -36,10 +41,16 @@ class ImageFormat:
         self.dots_per_unit = dots_per_unit
     
 
-class Image:
+class Image(object):
     """
     Image item
     """
+    __slots__ = ("ctx", "fmt", "filename", "pixbuf", "pb_w", "pb_h", "scale_x",
+        "scale_y", "scale_xy")
+    
+    # decoded images, which are shared by images of the same file and size,
+    # e.g. logos. Set to `LRUCache(0)` to disable caching
+    pixbuf_cache = LRUCache(16)
     
     def __init__(self, ctx, filename, fmt):
         """
@@ -52,14 +63,7 @@ class Image:
         self.ctx = ctx
         self.fmt = fmt
         self.filename = filename
-        
-        try:
-            self.pixbuf = gtk.gdk.pixbuf_new_from_file_at_size(self.filename,
-                int(self.fmt.dots_per_unit*self.fmt.width),
-                int(self.fmt.dots_per_unit*self.fmt.height))
-        except Exception as e:
-            raise RenderError("LOADING_IMAGE_FAILED", self.filename, e.args[0])
-        
+        self.pixbuf = self._load()
         self.pb_w = self.pixbuf.get_width()
         self.pb_h = self.pixbuf.get_height()
         self.scale_x = self.fmt.width/float(self.pb_w)
@@ -67,6 +71,61 @@ class Image:
         self.scale_xy = min(self.scale_x, self.scale_y)
     
     
+    def __getstate__(self):
+        """
+        Implemented because gtk.gdk.Pixbuf can not be pickled. The image is
+        loaded again when it is drawn
+        """
+        state = {k:getattr(self, k) for k in self.__slots__}
+        state["pixbuf"] = None
+        return state
+    
+    
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+    
+    
+    def __copy__(self):
+        """
+        Implemented because `__getstate__()` drops the pixbuf, copies share
+        the pixbuf instead
+        """
+        obj = self.__class__.__new__(self.__class__)
+        for k in self.__slots__:
+            setattr(obj, k, getattr(self, k))
+        return obj
+    
+    
+    def _load(self):
+        """
+        Load image file or take it from `Image.pixbuf_cache` and return
+        pixbuf
+        """
+        import gtk
+        w = int(self.fmt.dots_per_unit*self.fmt.width)
+        h = int(self.fmt.dots_per_unit*self.fmt.height)
+        try:
+            key = (self.filename, os.path.getmtime(self.filename), w, h)
+        except OSError:
+            key = None
+        pixbuf = self.pixbuf_cache.get(key) if key else None
+        if pixbuf != None:
+            return pixbuf
+        
+        with span("Image.load", filename=self.filename):
+            try:
+                pixbuf = gtk.gdk.pixbuf_new_from_file_at_size(self.filename,
+                    w, h)
+                counts["pixbuf_decodes"] += 1
+            except Exception as e:
+                raise RenderError("LOADING_IMAGE_FAILED", self.filename,
+                    e.args[0])
+        if key:
+            self.pixbuf_cache.put(key, pixbuf)
+        return pixbuf
+    
+    
     def draw(self, x, y):
         """
         Parameters
@@ -76,6 +135,7 @@ class Image:
         """
         cctx = self.ctx.get_cairo_context()
         cctx.save()
+        counts["saves"] += 1
         
         if self.fmt.center:
             # center image inside bounding box
@@ -88,7 +148,14 @@ class Image:
         pos_x = x/self.scale_xy
         pos_y = y/self.scale_xy
         
+        if not hasattr(cctx, "set_source_pixbuf"):
+            # plain cairo context of a `RenderContext`
+            import gtk
+            cctx = gtk.gdk.CairoContext(cctx)
         cctx.rectangle(pos_x, pos_y, self.pb_w, self.pb_h)
+        if self.pixbuf == None:
+            self.pixbuf = self._load()
         cctx.set_source_pixbuf(self.pixbuf, pos_x, pos_y)
         cctx.fill()
+        counts["fills"] += 1
         cctx.restore()
@@ -14,14 +14,25 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import gtk
 import cairo
 import math
+import pango
+from counters import counts
+from tracing import traced
 
-class LineFormat:
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# rgb values of parsed colors
+_colors = {}
+
+class LineFormat(object):
     """
     Definition of line format
     """
+    __slots__ = ("width", "style", "color", "dl")
     
     def __init__(self, width=0.1, style="solid", color="#000000", dl=None):
         """
@@ -40,10 +51,11 @@ class LineFormat:
         self.dl = dl
 
 
-class Line:
+class Line(object):
     """
     Line item
     """
+    __slots__ = ("ctx", "fmt", "dx", "dy")
     
     def __init__(self, ctx, dx=0, dy=0, fmt=LineFormat()):
         """
@@ -60,6 +72,7 @@ class Line:
         self.dy = dy
     
     
+    @traced("Line.stroke")
     def draw(self, x, y):
         """
         Parameters
@@ -73,9 +86,10 @@ class Line:
         # save current cairo context to be able to reset it after the 
         # line rendering
         cctx.save()
+        counts["saves"] += 1
         
         cctx.set_line_width(self.fmt.width)
-        cctx.set_source_color(gtk.gdk.Color(self.fmt.color))
+        cctx.set_source_rgb(*_rgb(self.fmt.color))
         if self.fmt.style == "double":
             # calculate position of double lines
             if self.fmt.dl:
@@ -89,9 +103,11 @@ class Line:
             cctx.move_to(x-dlx, y+dly)
             cctx.line_to(x+self.dx-dlx, y+self.dy+dly)
             cctx.stroke()
+            counts["strokes"] += 1
             cctx.move_to(x+dlx, y-dly)
             cctx.line_to(x+self.dx+dlx, y+self.dy-dly)
             cctx.stroke()
+            counts["strokes"] += 1
         else:
             if self.fmt.style == "dotted":
                 # auto calculate a "good" distance depending on line width
@@ -103,4 +119,259 @@ class Line:
             cctx.move_to(x, y)
             cctx.line_to(x+self.dx, y+self.dy)
             cctx.stroke()
+            counts["strokes"] += 1
+        cctx.restore()
+
+
+class Polyline(object):
+    """
+    Connected line segments through many points, which are drawn as a single
+    cairo path. The style "double" is drawn as "solid"
+    """
+    __slots__ = ("ctx", "fmt", "xs", "ys", "resolution")
+    
+    def __init__(self, ctx, xs, ys, fmt=LineFormat(), resolution=None):
+        """
+        Parameters
+        ----------
+        ctx : gtk.PrintContext
+        xs,ys : list<float>, numpy.ndarray
+            Position of points regarding render position
+        fmt : LineFormat
+        resolution : None, float
+            If set, points are decimated to this resolution, e.g. the size of
+            an output pixel in user units. Consecutive points within the same
+            cell of a grid of this size are drawn as one point
+        """
+        self.ctx = ctx
+        self.fmt = fmt
+        self.xs = xs
+        self.ys = ys
+        self.resolution = resolution
+    
+    
+    def get_points(self):
+        """
+        Return points (xs, ys) after decimation
+        """
+        return _decimate(self.xs, self.ys, self.resolution, False)
+    
+    
+    @traced("Polyline.stroke")
+    def draw(self, x, y):
+        """
+        Parameters
+        ----------
+        x,y : float
+            Absolute position of the origin of the points
+        """
+        xs, ys = self.get_points()
+        if len(xs) == 0:
+            return
+        cctx = self.ctx.get_cairo_context()
+        cctx.save()
+        counts["saves"] += 1
+        _set_format(cctx, self.fmt)
+        cctx.translate(x, y)
+        cctx.move_to(xs[0], ys[0])
+        line_to = cctx.line_to
+        for px, py in zip(xs[1:], ys[1:]):
+            line_to(px, py)
+        cctx.stroke()
+        counts["strokes"] += 1
+        cctx.restore()
+
+
+class Scatter(object):
+    """
+    Circular markers at many points, which are filled as a single cairo path
+    """
+    __slots__ = ("ctx", "fmt", "xs", "ys", "size", "resolution")
+    
+    def __init__(self, ctx, xs, ys, size=1, fmt=LineFormat(),
+            resolution=None):
+        """
+        Parameters
+        ----------
+        ctx : gtk.PrintContext
+        xs,ys : list<float>, numpy.ndarray
+            Position of points regarding render position
+        size : float
+            Diameter of markers
+        fmt : LineFormat
+            Only the color is used
+        resolution : None, float
+            If set, points within the same cell of a grid of this size are
+            drawn as one marker
+        """
+        self.ctx = ctx
+        self.fmt = fmt
+        self.xs = xs
+        self.ys = ys
+        self.size = size
+        self.resolution = resolution
+    
+    
+    def get_points(self):
+        """
+        Return points (xs, ys) after decimation
+        """
+        return _decimate(self.xs, self.ys, self.resolution, True)
+    
+    
+    @traced("Scatter.fill")
+    def draw(self, x, y):
+        """
+        Parameters
+        ----------
+        x,y : float
+            Absolute position of the origin of the points
+        """
+        xs, ys = self.get_points()
+        r = self.size/2.
+        cctx = self.ctx.get_cairo_context()
+        cctx.save()
+        counts["saves"] += 1
+        cctx.set_source_rgb(*_rgb(self.fmt.color))
+        cctx.translate(x, y)
+        for px, py in zip(xs, ys):
+            cctx.move_to(px + r, py)
+            cctx.arc(px, py, r, 0, 2*math.pi)
+        cctx.fill()
+        counts["fills"] += 1
         cctx.restore()
+
+
+class Bars(object):
+    """
+    Vertical bars standing on a common baseline, which are filled as a single
+    cairo path
+    """
+    __slots__ = ("ctx", "fmt", "xs", "heights", "width")
+    
+    def __init__(self, ctx, xs, heights, width=1, fmt=LineFormat()):
+        """
+        Parameters
+        ----------
+        ctx : gtk.PrintContext
+        xs : list<float>, numpy.ndarray
+            Horizontal position of the bar centers regarding render position
+        heights : list<float>, numpy.ndarray
+            Heights of the bars above the baseline, negative heights are drawn
+            below the baseline
+        width : float
+            Width of bars
+        fmt : LineFormat
+            Only the color is used
+        """
+        self.ctx = ctx
+        self.fmt = fmt
+        self.xs = xs
+        self.heights = heights
+        self.width = width
+    
+    
+    @traced("Bars.fill")
+    def draw(self, x, y):
+        """
+        Parameters
+        ----------
+        x,y : float
+            Absolute position of the origin of the bars on the baseline
+        """
+        cctx = self.ctx.get_cairo_context()
+        cctx.save()
+        counts["saves"] += 1
+        cctx.set_source_rgb(*_rgb(self.fmt.color))
+        cctx.translate(x - self.width/2., y)
+        for px, h in zip(self.xs, self.heights):
+            cctx.rectangle(px, 0, self.width, -h)
+        cctx.fill()
+        counts["fills"] += 1
+        cctx.restore()
+
+
+def _rgb(color):
+    """
+    Return tuple (r, g, b) of color string with values between 0 and 1
+    
+    Parameters
+    ----------
+    color : string
+    """
+    rgb = _colors.get(color)
+    if rgb == None:
+        c = pango.Color(color)
+        rgb = (c.red/65535., c.green/65535., c.blue/65535.)
+        _colors[color] = rgb
+    return rgb
+
+
+def _set_format(cctx, fmt):
+    """
+    Set line width, color and dash pattern of line format
+    
+    Parameters
+    ----------
+    cctx : cairo.Context
+    fmt : LineFormat
+    """
+    cctx.set_line_width(fmt.width)
+    cctx.set_source_rgb(*_rgb(fmt.color))
+    cctx.set_line_join(cairo.LINE_JOIN_ROUND)
+    if fmt.style == "dotted":
+        # auto calculate a "good" distance depending on line width
+        cctx.set_dash([0, fmt.width*(2+1./fmt.width)])
+        cctx.set_line_cap(cairo.LINE_CAP_ROUND)
+    elif fmt.style == "dashed":
+        # auto calculate a "good" distance depending on line width
+        cctx.set_dash([fmt.width*(2+1./fmt.width)])
+
+
+def _decimate(xs, ys, resolution, unique):
+    """
+    Return points (xs, ys), which are reduced to one point per cell of a grid
+    with the given resolution. If `unique` is False, only consecutive points
+    in the same cell are merged, which preserves the shape of a polyline.
+    Uses numpy if available
+    
+    Parameters
+    ----------
+    xs,ys : list<float>, numpy.ndarray
+    resolution : None, float
+    unique : bool
+    """
+    if not resolution or len(xs) <= 1:
+        return xs, ys
+    
+    if numpy:
+        xs = numpy.asarray(xs, dtype=float)
+        ys = numpy.asarray(ys, dtype=float)
+        cells = numpy.floor(numpy.column_stack((xs, ys))/resolution)
+        if unique:
+            keep = numpy.sort(numpy.unique(
+                cells.view([("x", float), ("y", float)]),
+                return_index=True)[1])
+        else:
+            keep = numpy.ones(len(xs), dtype=bool)
+            keep[1:] = numpy.any(cells[1:] != cells[:-1], axis=1)
+            keep[-1] = True
+        return xs[keep], ys[keep]
+    
+    xs_out = []
+    ys_out = []
+    seen = set()
+    last = None
+    n = len(xs)
+    for i in range(n):
+        cell = (math.floor(xs[i]/resolution), math.floor(ys[i]/resolution))
+        if unique:
+            if cell in seen:
+                continue
+            seen.add(cell)
+        elif cell == last and i != n - 1:
+            continue
+        last = cell
+        xs_out.append(xs[i])
+        ys_out.append(ys[i])
+    return xs_out, ys_out
@@ -0,0 +1,138 @@
+# pyspdf - a small and simple pdf renderer based on pygtk
+# Copyright (C) 2017 Lukas Schwarz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+from error import RenderError
+
+def merge_pdfs(parts, filename):
+    """
+    Merge pdf files into a single pdf file. Fonts and images, which are
+    identical in several input files, are written only once. Requires the
+    PyPDF2 package
+    
+    Parameters
+    ----------
+    parts : list<string, (string, int, int)>
+        Input pdf files. Either a filename for all pages of the file or a
+        tuple (filename, start, stop) for the page range [start, stop)
+    filename : string, file object
+        Output pdf file
+    """
+    try:
+        from PyPDF2 import PdfFileMerger
+    except ImportError:
+        raise RenderError("PDF_MERGE_NOT_AVAILABLE",
+            "Merging pdf files requires PyPDF2")
+    
+    merger = PdfFileMerger()
+    try:
+        for part in parts:
+            if isinstance(part, tuple):
+                merger.append(part[0], pages=part[1:])
+            else:
+                merger.append(part)
+        _share_resources([page.pagedata for page in merger.pages])
+        merger.write(filename)
+    except Exception as e:
+        raise RenderError("PDF_MERGE_FAILED", e.args[0] if e.args else None)
+    finally:
+        merger.close()
+
+
+def count_pages(filename):
+    """
+    Return number of pages of pdf file. Requires the PyPDF2 package
+    
+    Parameters
+    ----------
+    filename : string
+    """
+    try:
+        from PyPDF2 import PdfFileReader
+    except ImportError:
+        raise RenderError("PDF_MERGE_NOT_AVAILABLE",
+            "Merging pdf files requires PyPDF2")
+    
+    try:
+        with open(filename, "rb") as fh:
+            return PdfFileReader(fh).getNumPages()
+    except Exception as e:
+        raise RenderError("PDF_MERGE_FAILED", e.args[0] if e.args else None)
+
+
+def _share_resources(pages):
+    """
+    Replace fonts and images (XObjects) of pages by identical fonts and images
+    of previous pages, so they are written only once
+    
+    Parameters
+    ----------
+    pages : list<PyPDF2.pdf.PageObject>
+    """
+    from PyPDF2.generic import IndirectObject, NameObject
+    
+    # first reference of each resource indexed by digest of its content
+    refs = {}
+    for page in pages:
+        resources = page.get("/Resources")
+        if resources == None:
+            continue
+        resources = resources.getObject()
+        for kind in ("/Font", "/XObject"):
+            if kind not in resources:
+                continue
+            entries = resources[kind].getObject()
+            for name in list(entries.keys()):
+                ref = entries.raw_get(name)
+                if not isinstance(ref, IndirectObject):
+                    continue
+                digest = hashlib.sha1()
+                _digest(ref.getObject(), digest, set())
+                entries[NameObject(name)] = refs.setdefault(
+                    digest.hexdigest(), ref)
+
+
+def _digest(obj, digest, visited):
+    """
+    Update hash `digest` with the content of pdf object `obj` including the
+    data of streams and the content of referenced objects
+    """
+    from PyPDF2.generic import IndirectObject, DictionaryObject, \
+        ArrayObject, StreamObject
+    
+    if isinstance(obj, IndirectObject):
+        key = (id(obj.pdf), obj.idnum, obj.generation)
+        if key in visited:
+            digest.update("ref")
+            return
+        visited.add(key)
+        obj = obj.getObject()
+    if isinstance(obj, DictionaryObject):
+        digest.update("dict{")
+        for k in sorted(obj.keys()):
+            digest.update(repr(str(k)))
+            _digest(obj.raw_get(k), digest, visited)
+        if isinstance(obj, StreamObject):
+            digest.update("stream")
+            digest.update(obj._data)
+        digest.update("}")
+    elif isinstance(obj, ArrayObject):
+        digest.update("array[")
+        for item in obj:
+            _digest(item, digest, visited)
+        digest.update("]")
+    else:
+        digest.update(repr((type(obj).__name__, obj)))
@@ -14,34 +14,146 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import gtk
+import io
+import os
+import math
+import shutil
+import tempfile
+import time
+import multiprocessing
+import Queue
+import cairo
 from error import RenderError
+from context import RenderContext, Fingerprint
+from merge import merge_pdfs, count_pages
+import tracing
 
-class PDF:
+# values of gtk constants, which can be used without importing gtk
+UNIT_PIXEL = 0
+UNIT_POINTS = 1
+UNIT_INCH = 2
+UNIT_MM = 3
+PAPER_NAME_A3 = "iso_a3"
+PAPER_NAME_A4 = "iso_a4"
+PAPER_NAME_A5 = "iso_a5"
+PAPER_NAME_B5 = "iso_b5"
+PAPER_NAME_LETTER = "na_letter"
+PAPER_NAME_EXECUTIVE = "na_executive"
+PAPER_NAME_LEGAL = "na_legal"
+PAGE_ORIENTATION_PORTRAIT = 0
+PAGE_ORIENTATION_LANDSCAPE = 1
+PAGE_ORIENTATION_REVERSE_PORTRAIT = 2
+PAGE_ORIENTATION_REVERSE_LANDSCAPE = 3
+
+# size of units in units per inch
+UNITS_PER_INCH = {
+    UNIT_PIXEL: 72.,
+    UNIT_POINTS: 72.,
+    UNIT_INCH: 1.,
+    UNIT_MM: 25.4,
+}
+
+# size of paper in mm, other paper names are looked up via gtk.PaperSize
+PAPER_SIZES = {
+    PAPER_NAME_A3: (297., 420.),
+    PAPER_NAME_A4: (210., 297.),
+    PAPER_NAME_A5: (148., 210.),
+    PAPER_NAME_B5: (176., 250.),
+    PAPER_NAME_LETTER: (215.9, 279.4),
+    PAPER_NAME_EXECUTIVE: (184.15, 266.7),
+    PAPER_NAME_LEGAL: (215.9, 355.6),
+}
+
+class Progress(object):
+    """
+    Progress of rendering, which is passed to the progress callback (see
+    `PDF.set_progress_callback()`)
+    
+    Parameters
+    ----------
+    stage : string ("paginate", "page", "write")
+        "paginate" after pagination, "page" after a page is drawn and "write"
+        after the file is written
+    page : None, int
+        Number of the drawn page
+    page_cnt : int
+        Number of pages to draw
+    pages_done : int
+        Number of drawn pages
+    bytes_written : None, int
+        Size of the output file, if known
+    elapsed : float
+        Seconds since the rendering started
+    eta : None, float
+        Estimated seconds until all pages are drawn based on the page rate so
+        far
+    """
+    __slots__ = ("stage", "page", "page_cnt", "pages_done", "bytes_written",
+        "elapsed", "eta", "start", "start_pages")
+    
+    def __init__(self):
+        self.stage = None
+        self.page = None
+        self.page_cnt = 0
+        self.pages_done = 0
+        self.bytes_written = None
+        self.elapsed = 0
+        self.eta = None
+        self.start = time.time()
+        self.start_pages = self.start
+
+
+class PDF(object):
     """
     Abstract PDF document class providing an interface for either saving or 
-    printing a PDF document. The class uses gtk.PrintOperation internally.
+    printing a PDF document. The class uses gtk.PrintOperation internally
+    or renders directly with cairo (see `backend`).
     """
     
-    def __init__(self, unit=gtk.UNIT_MM, size=gtk.PAPER_NAME_A4,
-            orientation=gtk.PAGE_ORIENTATION_PORTRAIT):
+    def __init__(self, unit=UNIT_MM, size=PAPER_NAME_A4,
+            orientation=PAGE_ORIENTATION_PORTRAIT, backend="gtk"):
         """
         Parameters
         ----------
         unit : gtk unit constant
         size : gtk paper name constant
         orientation : gtk page orientation constant
+        backend : "gtk", "cairo"
+            Backend used to save the pdf. "gtk" uses gtk.PrintOperation,
+            "cairo" renders the pages directly onto cairo pdf surfaces using a
+            `RenderContext` instead of gtk.PrintContext. Printing always uses
+            gtk
         
         see http://www.pygtk.org/pygtk2reference/gtk-constants.html
-        for available constantes
+        for available constantes. The gtk constants of units, common paper
+        names and orientations are also defined in this module, gtk is only
+        imported when rendering with the "gtk" backend or printing
         """
         self.op = None
-        self.page_setup = gtk.PageSetup()
-        self.page_setup.set_orientation(orientation)
-        self.page_setup.set_paper_size(gtk.PaperSize(size))
+        self.ctx = None
+        self.backend = backend
+        self.page_cnt = 0
+        self.render_cache = None
+        self.page_cache = None
+        self.static_pages = {}
+        self.progress_callback = None
+        self.progress = None
+        self.progress_queue = None
+        self.deferred_drawing = False
+        self.deferred_values = {}
+        self._page_setup = None
+        self.size = size
+        self.orientation = orientation
         self.unit = unit
-        self.w = self.page_setup.get_paper_size().get_width(unit)
-        self.h = self.page_setup.get_paper_size().get_height(unit)
+        if size in PAPER_SIZES:
+            scale = UNITS_PER_INCH[unit]/25.4
+            self.w = PAPER_SIZES[size][0]*scale
+            self.h = PAPER_SIZES[size][1]*scale
+        else:
+            import gtk
+            paper_size = gtk.PaperSize(size)
+            self.w = paper_size.get_width(unit)
+            self.h = paper_size.get_height(unit)
         
         # Workaround:
         # Variable `self.error` keeps track of exceptions raised during print
@@ -56,15 +168,149 @@ class PDF:
         self.error = None
     
     
-    def save_to_file(self, filename):
+    @property
+    def page_setup(self):
+        """
+        gtk.PageSetup used by the "gtk" backend and for printing. It is
+        created on first access, so gtk is only imported if it is used, and
+        can be configured before rendering, e.g. its margins
+        """
+        if self._page_setup == None:
+            import gtk
+            self._page_setup = gtk.PageSetup()
+            self._page_setup.set_orientation(self.orientation)
+            self._page_setup.set_paper_size(gtk.PaperSize(self.size))
+        return self._page_setup
+    
+    
+    @page_setup.setter
+    def page_setup(self, page_setup):
+        self._page_setup = page_setup
+    
+    
+    def save_to_file(self, filename, processes=1):
         """
         Save pdf to file
         
         Parameters
         ----------
         filename : string
+        processes : int
+            Number of worker processes rendering the pages. If greater than 1,
+            the paginated document is distributed onto the workers as page
+            ranges, which are rendered into partial pdf files and merged
+            afterwards. Requires the "cairo" backend
         """
-        self.__render("save", filename)
+        key = self.__cache_key()
+        if key:
+            if self.render_cache.get(key, filename):
+                return
+            
+            # the file may be a hardlink of a cached file, which must not be
+            # overwritten in place
+            if os.path.isfile(filename) and not os.path.islink(filename):
+                os.remove(filename)
+        
+        if self.backend == "cairo":
+            self.__render_cairo(filename, processes)
+        elif processes > 1:
+            raise ValueError("Rendering in multiple processes requires " +
+                "the 'cairo' backend")
+        else:
+            self.__render("save", filename)
+        self.__splice_static_pages(filename)
+        self._report_progress("write", filename=filename)
+        
+        if key:
+            self.render_cache.put(key, filename)
+    
+    
+    def render_to_bytes(self, processes=1):
+        """
+        Render pdf and return its content
+        
+        Parameters
+        ----------
+        processes : int
+            see `save_to_file()`
+        """
+        key = self.__cache_key()
+        if key:
+            data = self.render_cache.get_bytes(key)
+            if data != None:
+                return data
+        
+        fd, filename = tempfile.mkstemp(suffix=".pdf", prefix="pyspdf")
+        os.close(fd)
+        try:
+            render_cache = self.render_cache
+            self.render_cache = None
+            try:
+                self.save_to_file(filename, processes)
+            finally:
+                self.render_cache = render_cache
+            with open(filename, "rb") as fh:
+                data = fh.read()
+        finally:
+            os.remove(filename)
+        
+        if key:
+            self.render_cache.put_bytes(key, data)
+        return data
+    
+    
+    def render_png(self, pages=None, dpi=96., processes=1, paginate=True):
+        """
+        Render pages to png images with the "cairo" backend and return a list
+        of their contents. Static pages (see `PDF._add_static_pages()`) are
+        rendered blank
+        
+        Parameters
+        ----------
+        pages : None, list<int>
+            Numbers of pages to render, all pages if None
+        dpi : float
+            Resolution of the images
+        processes : int
+            Number of worker processes, which render a part of the pages each
+        paginate : bool
+            If False, the pagination and layouts of the previous rendering
+            with the "cairo" backend (`save_to_file()` or `render_png()`)
+            are reused
+        
+        With deferred drawing (see `set_deferred_drawing()`), all pages are
+        drawn in a single process before the requested pages are rendered
+        """
+        if paginate or not isinstance(self.ctx, RenderContext):
+            self.__paginate_cairo()
+        else:
+            self.progress = Progress()
+        if self.deferred_drawing:
+            if processes > 1:
+                raise ValueError("Deferred drawing requires rendering in a " +
+                    "single process")
+            return self._render_deferred_png(pages, dpi)
+        if pages == None:
+            pages = range(self.page_cnt)
+        for no in pages:
+            if not 0 <= no < self.page_cnt:
+                raise ValueError("Invalid page number {}".format(no))
+        self.progress.page_cnt = len(pages)
+        
+        tmpdir = tempfile.mkdtemp(prefix="pyspdf")
+        try:
+            pattern = os.path.join(tmpdir, "{}.png")
+            n = max(1, (len(pages) + processes - 1)//processes)
+            jobs = [(pattern, pages[i:i+n]) for i in range(0, len(pages), n)]
+            self._render_jobs(jobs, processes,
+                lambda pattern, pages: self._render_png(pattern, pages, dpi))
+            images = []
+            for no in pages:
+                with open(pattern.format(no), "rb") as fh:
+                    images.append(fh.read())
+        finally:
+            shutil.rmtree(tmpdir)
+        return images
     
     
     def show_print_dialog(self):
@@ -74,6 +320,133 @@ class PDF:
         self.__render("print")
     
     
+    def set_render_cache(self, cache):
+        """
+        Set cache of rendered documents. Requires the implementation of
+        `PDF._cache_key()`. If the cache contains a document with the same
+        key, it is used instead of rendering the document again
+        
+        Parameters
+        ----------
+        cache : None, RenderCache
+        """
+        self.render_cache = cache
+    
+    
+    def set_page_cache(self, cache):
+        """
+        Set cache of rendered pages, requires the "cairo" backend. After
+        pagination, each page is fingerprinted by hashing its drawing
+        operations. Only pages whose fingerprint is not found in the cache
+        are rendered, all other pages are taken from the cache. Requires
+        PyPDF2 to merge the pages and `_draw_page()` to draw the same content
+        each time it is called for a page
+        
+        Parameters
+        ----------
+        cache : None, RenderCache
+        """
+        self.page_cache = cache
+    
+    
+    def set_progress_callback(self, callback):
+        """
+        Set function, which is called with a `Progress` object after
+        pagination, after each drawn page and after the file is written. If
+        the function returns True, the rendering is canceled and
+        RenderError("CANCELLED") is raised. Replaces the progress dialog of
+        the "gtk" backend. Pages drawn in worker processes are reported in
+        the main process
+        
+        Parameters
+        ----------
+        callback : None, function(Progress)
+        """
+        self.progress_callback = callback
+    
+    
+    def set_deferred_drawing(self, enabled):
+        """
+        Enable drawing of `DeferredText` items, requires the "cairo" backend
+        and rendering in a single process. The pages are recorded and the
+        deferred texts are drawn onto them when all pages are drawn. This
+        allows `_draw_page()` to increase the page count via
+        `_set_page_count()`, e.g. to flow content, while "page X of Y" texts
+        are still rendered in one pass
+        
+        Parameters
+        ----------
+        enabled : bool
+        """
+        self.deferred_drawing = enabled
+    
+    
+    def _set_deferred_value(self, name, value):
+        """
+        Set value of placeholder of `DeferredText` items, e.g. the page range
+        of a section. Call this method from within `_paginate()` or
+        `_draw_page()`
+        
+        Parameters
+        ----------
+        name : string
+        value : mixed
+        """
+        self.deferred_values[name] = value
+    
+    
+    def _report_progress(self, stage, page=None, filename=None):
+        """
+        Update progress and call progress callback. Raises
+        RenderError("CANCELLED") if the callback requests to cancel the
+        rendering
+        
+        Parameters
+        ----------
+        stage : string ("paginate", "page", "write")
+        page : None, int
+            Number of drawn page
+        filename : None, string
+            Output file to determine the bytes written
+        """
+        if not self.progress_callback:
+            return
+        if self.progress_queue:
+            # worker process, progress is reported by the main process
+            self.progress_queue.put((stage, page, filename))
+            return
+        
+        progress = self.progress
+        now = time.time()
+        progress.stage = stage
+        progress.page = page
+        progress.elapsed = now - progress.start
+        if stage == "paginate":
+            progress.page_cnt = self._get_page_count()
+            progress.start_pages = now
+        elif stage == "page":
+            progress.pages_done += 1
+            rate = progress.pages_done/max(now - progress.start_pages, 1e-6)
+            progress.eta = (progress.page_cnt - progress.pages_done)/rate
+        if isinstance(filename, basestring) and os.path.exists(filename):
+            progress.bytes_written = os.path.getsize(filename)
+        
+        if self.progress_callback(progress) and stage != "write":
+            raise RenderError("CANCELLED")
+    
+    
+    def _cache_key(self):
+        """
+        Method can be implemented to enable caching of rendered documents
+        (see `PDF.set_render_cache()`). It has to return a deterministic
+        representation (e.g. a tuple of strings and numbers) of all inputs
+        affecting the output like data, formats and fonts. Documents with
+        equal keys must be identical. Returns None if the document must not
+        be cached
+        """
+        return None
+    
+    
     def _paginate(self, op, ctx):
         """
         Method is called before the rendering process starts. It has to 
@@ -111,14 +484,121 @@ class PDF:
         ----------
         page_cnt : total count of pages
         """
-        self.op.set_n_pages(page_cnt)
+        self.page_cnt = page_cnt
+        if self.op:
+            self.op.set_n_pages(page_cnt)
+    
+    
+    def _add_static_pages(self, no, filename):
+        """
+        Insert pre-rendered pages at page `no`. Call this method from within
+        the `PDF._paginate()` method. Returns the number of inserted pages,
+        which have to be included in the page count. `PDF._draw_page()` is
+        not called for these pages, they are replaced by the pages of the
+        pdf file `filename` after rendering. The file is typically rendered
+        once by another `PDF` subclass, e.g. fixed terms and conditions or a
+        cover page. Requires PyPDF2. Static pages are only inserted when
+        saving, they are printed blank
+        
+        Parameters
+        ----------
+        no : int
+            Number of first inserted page
+        filename : string
+            Pre-rendered pdf file
+        """
+        n = count_pages(filename)
+        for start, (fragment, cnt) in self.static_pages.items():
+            if start < no + n and no < start + cnt:
+                raise ValueError("Static pages overlap")
+        self.static_pages[no] = (filename, n)
+        return n
+    
+    
+    def _is_static_page(self, no):
+        """
+        Return whether page `no` is replaced by a pre-rendered page
+        (see `PDF._add_static_pages()`)
+        
+        Parameters
+        ----------
+        no : int
+        """
+        for start, (fragment, cnt) in self.static_pages.items():
+            if start <= no < start + cnt:
+                return True
+        return False
     
     
     def _get_page_count(self):
         """
         Return page count set by `_set_page_count()`
         """
-        return self.op.get_n_pages_to_print()
+        if self.op:
+            return self.op.get_n_pages_to_print()
+        return self.page_cnt
+    
+    
+    def _get_page_size(self, scale=1.):
+        """
+        Return size (w, h) of pages in the given orientation, `self.w` and
+        `self.h` are the size of the paper in portrait orientation
+        
+        Parameters
+        ----------
+        scale : float
+            Size of a unit in the returned size
+        """
+        if self.orientation in (PAGE_ORIENTATION_LANDSCAPE,
+                PAGE_ORIENTATION_REVERSE_LANDSCAPE):
+            return self.h*scale, self.w*scale
+        return self.w*scale, self.h*scale
+    
+    
+    def __cache_key(self):
+        """
+        Return key of document in render cache or None if not cached
+        """
+        if not self.render_cache:
+            return None
+        data = self._cache_key()
+        if data == None:
+            return None
+        from pyspdf import __version__
+        return self.render_cache.key((__version__, self.__class__.__module__,
+            self.__class__.__name__, self.unit, self.w, self.h,
+            self.orientation, self.backend, data))
+    
+    
+    def __splice_static_pages(self, filename):
+        """
+        Replace the blank placeholder pages of static pages in the rendered
+        file `filename` by the pre-rendered pages
+        
+        Parameters
+        ----------
+        filename : string
+        """
+        if not self.static_pages:
+            return
+        
+        fd, tmp = tempfile.mkstemp(suffix=".pdf", prefix="pyspdf")
+        os.close(fd)
+        try:
+            shutil.copyfile(filename, tmp)
+            parts = []
+            no = 0
+            for start in sorted(self.static_pages):
+                fragment, n = self.static_pages[start]
+                if start > no:
+                    parts.append((tmp, no, start))
+                parts.append(fragment)
+                no = start + n
+            if no < self.page_cnt:
+                parts.append((tmp, no, self.page_cnt))
+            merge_pdfs(parts, filename)
+        finally:
+            os.remove(tmp)
     
     
     def __render(self, action, filename=None):
@@ -130,6 +610,9 @@ class PDF:
         action : string ("save", "print")
         filename : string
         """
+        import gtk
+        self.error = None
+        self.progress = Progress()
         
         # create print operation
         self.op = gtk.PrintOperation()
@@ -138,7 +621,7 @@ class PDF:
         self.op.set_unit(self.unit)
         self.op.connect("begin-print", self.__paginate)
         self.op.connect("draw-page", self.__draw_page)
-        self.op.set_show_progress(True)
+        self.op.set_show_progress(not self.progress_callback)
         self.op.set_allow_async(True)
         
         # run print operation
@@ -168,9 +651,12 @@ class PDF:
         ctx : gtk.PrintContext
         """
         try:
-            self._paginate(op, ctx)
+            self.static_pages = {}
+            with tracing.span("PDF._paginate"):
+                self._paginate(op, ctx)
             if op.get_n_pages_to_print() == 0:
                 raise RenderError("NO_PAGES")
+            self._report_progress("paginate")
         except RenderError as e:
             op.cancel()
             self.error = e
@@ -187,7 +673,338 @@ class PDF:
         ctx : gtk.PrintContext
         """
         try:
-            self._draw_page(op, ctx, no)
+            if not self._is_static_page(no):
+                with tracing.span("PDF._draw_page", page=no):
+                    self._draw_page(op, ctx, no)
+            self._report_progress("page", no)
         except RenderError as e:
             op.cancel()
             self.error = e
+    
+    
+    def __render_cairo(self, filename, processes=1):
+        """
+        Render pages with the "cairo" backend and save result
+        
+        Parameters
+        ----------
+        filename : string
+        processes : int
+        """
+        self.__paginate_cairo()
+        if self.deferred_drawing:
+            if processes > 1 or self.page_cache:
+                raise ValueError("Deferred drawing requires rendering in a " +
+                    "single process without page cache")
+            self._render_deferred(filename)
+            return
+        
+        pages = range(self.page_cnt)
+        if processes <= 1 and not self.page_cache:
+            self._render_pages(filename, pages)
+            return
+        
+        tmpdir = tempfile.mkdtemp(prefix="pyspdf")
+        try:
+            if self.page_cache:
+                # render only pages, whose fingerprint is not cached, into
+                # single page files and splice them with the cached pages
+                parts = []
+                jobs = []
+                for no in pages:
+                    key = self.__page_key(no)
+                    parts.append(self.page_cache.get_path(key) if key else
+                        None)
+                    if parts[-1] == None:
+                        jobs.append((os.path.join(tmpdir,
+                            "{}.pdf".format(no)), [no], key))
+                self.progress.page_cnt = len(jobs)
+                self._render_jobs(jobs, processes)
+                for filename_page, pages_job, key in jobs:
+                    if key:
+                        self.page_cache.put(key, filename_page, False)
+                    parts[pages_job[0]] = filename_page
+                merge_pdfs(parts, filename)
+                self.page_cache.evict()
+            else:
+                # split pages into one range per process
+                n = (len(pages) + processes - 1)//processes
+                jobs = [(os.path.join(tmpdir, "{}.pdf".format(i)),
+                    pages[i:i+n]) for i in range(0, len(pages), n)]
+                self._render_jobs(jobs, processes)
+                merge_pdfs([job[0] for job in jobs], filename)
+        finally:
+            shutil.rmtree(tmpdir)
+    
+    
+    def __paginate_cairo(self):
+        """
+        Paginate document with a `RenderContext` for the "cairo" backend
+        """
+        self.op = None
+        self.ctx = RenderContext(UNITS_PER_INCH[self.unit])
+        self.page_cnt = 0
+        self.static_pages = {}
+        self.deferred_values = {}
+        self.progress = Progress()
+        with tracing.span("PDF._paginate"):
+            self._paginate(None, self.ctx)
+        if self.page_cnt == 0:
+            raise RenderError("NO_PAGES")
+        self._report_progress("paginate")
+    
+    
+    def __page_key(self, no):
+        """
+        Return key of page `no` in page cache or None if the page can not be
+        cached. The key is a hash of all drawing operations of the page,
+        which are recorded by drawing the page onto a fingerprint instead of
+        a cairo context
+        
+        Parameters
+        ----------
+        no : int
+        """
+        self.ctx.set_surface(None)
+        fingerprint = Fingerprint(self.ctx.get_cairo_context())
+        self.ctx.set_cairo_context(fingerprint)
+        if not self._is_static_page(no):
+            self._draw_page(None, self.ctx, no)
+        if fingerprint.hexdigest() == None:
+            return None
+        from pyspdf import __version__
+        return self.page_cache.key((__version__, self.__class__.__module__,
+            self.__class__.__name__, self.unit, self.w, self.h,
+            self.orientation, fingerprint.hexdigest()))
+    
+    
+    def _render_jobs(self, jobs, processes, render=None):
+        """
+        Render pages of paginated document into files. If `processes` is
+        greater than 1, the jobs are distributed onto forked worker
+        processes, which inherit the paginated state
+        
+        Parameters
+        ----------
+        jobs : [(filename, pages, ...), ...]
+        processes : int
+        render : None, function(filename, pages)
+            Function rendering the pages of a job, `_render_pages()` if None
+        """
+        if not render:
+            render = self._render_pages
+        if processes <= 1 or len(jobs) <= 1:
+            for job in jobs:
+                render(job[0], job[1])
+            return
+        
+        workers = []
+        errors = multiprocessing.Queue()
+        progress = None
+        if self.progress_callback:
+            progress = multiprocessing.Queue()
+        self.progress_queue = progress
+        tracing.prepare_workers()
+        try:
+            for i in range(min(processes, len(jobs))):
+                workers.append(multiprocessing.Process(
+                    target=self._render_worker,
+                    args=(jobs[i::processes], render, errors)))
+                workers[-1].start()
+        finally:
+            self.progress_queue = None
+        
+        # report progress of workers until all have finished
+        try:
+            while progress:
+                try:
+                    self._report_progress(*progress.get(timeout=0.1))
+                except Queue.Empty:
+                    if not any(worker.is_alive() for worker in workers):
+                        break
+        except RenderError:
+            for worker in workers:
+                worker.terminate()
+            raise
+        finally:
+            for worker in workers:
+                worker.join()
+        # report events queued after the last check, the workers flushed
+        # their queues before exiting
+        while progress:
+            try:
+                self._report_progress(*progress.get_nowait())
+            except Queue.Empty:
+                break
+        if not errors.empty():
+            code, args = errors.get()
+            raise RenderError(code, *args)
+        for worker in workers:
+            if worker.exitcode != 0:
+                raise RenderError("UNKNOWN_ERROR")
+    
+    
+    def _render_worker(self, jobs, render, errors):
+        """
+        Render jobs in a worker process and report render errors via the
+        queue `errors`
+        
+        Parameters
+        ----------
+        jobs : [(filename, pages, ...), ...]
+        render : function(filename, pages)
+        errors : multiprocessing.Queue
+        """
+        try:
+            for job in jobs:
+                render(job[0], job[1])
+        except RenderError as e:
+            errors.put((e.code, e.args))
+        tracing.save_worker()
+    
+    
+    def _render_pages(self, filename, pages):
+        """
+        Draw given pages of paginated document onto a cairo pdf surface
+        
+        Parameters
+        ----------
+        filename : string, file object
+        pages : list<int>
+        """
+        w, h = self._get_page_size(72./UNITS_PER_INCH[self.unit])
+        surface = cairo.PDFSurface(filename, w, h)
+        self.ctx.set_surface(surface, 72.)
+        for no in pages:
+            if not self._is_static_page(no):
+                with tracing.span("PDF._draw_page", page=no):
+                    self._draw_page(None, self.ctx, no)
+            self.ctx.get_cairo_context().show_page()
+            self._report_progress("page", no, filename)
+        surface.finish()
+    
+    
+    def _record_pages(self):
+        """
+        Draw pages of paginated document onto recording surfaces in points
+        and return list of (recording, deferred texts with position) of each
+        page and the values of the deferred texts
+        """
+        w, h = self._get_page_size(72./UNITS_PER_INCH[self.unit])
+        pages = []
+        no = 0
+        while no < self.page_cnt:
+            recording = cairo.RecordingSurface(cairo.CONTENT_COLOR_ALPHA,
+                (0, 0, w, h))
+            self.ctx.set_surface(recording, 72.)
+            self.ctx.deferred = []
+            try:
+                if not self._is_static_page(no):
+                    with tracing.span("PDF._draw_page", page=no):
+                        self._draw_page(None, self.ctx, no)
+                pages.append((recording, self.ctx.deferred))
+            finally:
+                self.ctx.deferred = None
+            self._report_progress("page", no)
+            no += 1
+        return pages, dict(self.deferred_values, pages=len(pages))
+    
+    
+    def _render_deferred(self, filename):
+        """
+        Draw pages of paginated document onto recording surfaces, which are
+        replayed onto a cairo pdf surface together with the deferred texts
+        when all pages are drawn
+        
+        Parameters
+        ----------
+        filename : string, file object
+        """
+        pages, values = self._record_pages()
+        w, h = self._get_page_size(72./UNITS_PER_INCH[self.unit])
+        surface = cairo.PDFSurface(filename, w, h)
+        self.ctx.set_surface(surface, 72.)
+        cctx = self.ctx.get_cairo_context()
+        for no, (recording, deferred) in enumerate(pages):
+            cctx.save()
+            cctx.identity_matrix()
+            cctx.set_source_surface(recording, 0, 0)
+            cctx.paint()
+            cctx.restore()
+            for item, x, y in deferred:
+                item.resolve(dict(values, page=no + 1)).draw(x, y)
+            cctx.show_page()
+        surface.finish()
+    
+    
+    def _render_deferred_png(self, pages, dpi):
+        """
+        Draw pages of paginated document onto recording surfaces and return
+        the contents of png images of the given pages, onto which the
+        recordings are replayed together with the deferred texts
+        
+        Parameters
+        ----------
+        pages : None, list<int>
+            Numbers of pages to render, all pages if None
+        dpi : float
+        """
+        recordings, values = self._record_pages()
+        if pages == None:
+            pages = range(len(recordings))
+        for no in pages:
+            if not 0 <= no < len(recordings):
+                raise ValueError("Invalid page number {}".format(no))
+        
+        w, h = self._get_page_size(dpi/UNITS_PER_INCH[self.unit])
+        images = []
+        for no in pages:
+            recording, deferred = recordings[no]
+            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32,
+                int(math.ceil(w)), int(math.ceil(h)))
+            self.ctx.set_surface(surface, dpi)
+            cctx = self.ctx.get_cairo_context()
+            cctx.save()
+            cctx.set_source_rgb(1, 1, 1)
+            cctx.paint()
+            cctx.identity_matrix()
+            cctx.scale(dpi/72., dpi/72.)
+            cctx.set_source_surface(recording, 0, 0)
+            cctx.paint()
+            cctx.restore()
+            for item, x, y in deferred:
+                item.resolve(dict(values, page=no + 1)).draw(x, y)
+            data = io.BytesIO()
+            surface.write_to_png(data)
+            images.append(data.getvalue())
+        return images
+    
+    
+    def _render_png(self, pattern, pages, dpi):
+        """
+        Draw given pages of paginated document onto cairo image surfaces and
+        save them as png files
+        
+        Parameters
+        ----------
+        pattern : string
+            Filename of the images with a placeholder "{}" for the page number
+        pages : list<int>
+        dpi : float
+        """
+        w, h = self._get_page_size(dpi/UNITS_PER_INCH[self.unit])
+        w = int(math.ceil(w))
+        h = int(math.ceil(h))
+        for no in pages:
+            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, w, h)
+            self.ctx.set_surface(surface, dpi)
+            cctx = self.ctx.get_cairo_context()
+            cctx.save()
+            cctx.set_source_rgb(1, 1, 1)
+            cctx.paint()
+            cctx.restore()
+            if not self._is_static_page(no):
+                with tracing.span("PDF._draw_page", page=no):
+                    self._draw_page(None, self.ctx, no)
+            surface.write_to_png(pattern.format(no))
+            self._report_progress("page", no)
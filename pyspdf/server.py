@@ -0,0 +1,252 @@
+# pyspdf - a small and simple pdf renderer based on pygtk
+# Copyright (C) 2017 Lukas Schwarz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import multiprocessing
+import os
+import socket
+import SocketServer
+import stat
+import struct
+from error import RenderError
+from context import warm_up
+
+# factories of documents, which can be rendered by the server, indexed by
+# name
+_documents = {}
+
+def register(name, factory):
+    """
+    Register document, which can be rendered by a `RenderServer`. Documents
+    have to be registered before the `RenderServer` is constructed, as its
+    worker processes are forked by the constructor
+    
+    Parameters
+    ----------
+    name : string
+    factory : function(data)
+        Function returning a `PDF` object for the JSON data of a job, e.g. a
+        `PDF` subclass taking the data as argument
+    """
+    _documents[name] = factory
+
+
+class RenderServer(object):
+    """
+    Long-running render server, which accepts render jobs on a Unix socket
+    or local TCP port and renders them in a pool of worker processes. The
+    workers are started once and keep their loaded fonts, images and layout
+    caches between jobs
+    """
+    
+    def __init__(self, address, processes=None, fonts=()):
+        """
+        Parameters
+        ----------
+        address : string, (string, int)
+            Path of Unix socket or (host, port) of TCP socket
+        processes : None, int
+            Number of worker processes, number of CPUs if None
+        fonts : list<string, TextFormat>
+            Fonts loaded by each worker at startup (see `warm_up()`)
+        """
+        self.address = address
+        self.pool = multiprocessing.Pool(processes, _init_worker, (fonts,))
+        if isinstance(address, basestring):
+            _remove_socket(address)
+            self.server = _UnixServer(address, _Handler)
+        else:
+            self.server = _TCPServer(address, _Handler)
+        self.server.pool = self.pool
+    
+    
+    def serve_forever(self):
+        """
+        Handle render jobs until `shutdown()` is called
+        """
+        self.server.serve_forever()
+    
+    
+    def shutdown(self):
+        """
+        Stop `serve_forever()`, can be called from another thread
+        """
+        self.server.shutdown()
+    
+    
+    def close(self):
+        """
+        Close socket and stop worker processes
+        """
+        self.server.server_close()
+        self.pool.close()
+        self.pool.join()
+        if isinstance(self.address, basestring):
+            _remove_socket(self.address)
+
+
+def _remove_socket(path):
+    """
+    Remove Unix socket of given path, other files are kept
+    """
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.remove(path)
+
+
+class RenderClient(object):
+    """
+    Client of a `RenderServer`. The connection is kept open between jobs
+    """
+    
+    def __init__(self, address):
+        """
+        Parameters
+        ----------
+        address : string, (string, int)
+            Path of Unix socket or (host, port) of TCP socket
+        """
+        self.address = address
+        self.sock = None
+    
+    
+    def render(self, document, data=None):
+        """
+        Render registered document with given JSON data and return content
+        of the pdf. Raises the RenderError of the document if rendering fails
+        
+        Parameters
+        ----------
+        document : string
+            Name of registered document
+        data : mixed
+            JSON serializable data passed to the document factory
+        """
+        if not self.sock:
+            family = socket.AF_UNIX if isinstance(self.address, basestring) \
+                else socket.AF_INET
+            self.sock = socket.socket(family, socket.SOCK_STREAM)
+            self.sock.connect(self.address)
+        try:
+            _send(self.sock, json.dumps({"document": document, "data": data}))
+            result = json.loads(_recv(self.sock))
+            if not result["ok"]:
+                raise RenderError(result["code"], *result["args"])
+            return _recv(self.sock)
+        except (socket.error, EOFError):
+            self.close()
+            raise
+    
+    
+    def close(self):
+        """
+        Close connection
+        """
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+
+class _Handler(SocketServer.BaseRequestHandler):
+    """
+    Handler of a client connection, which passes its jobs to the workers
+    """
+    
+    def handle(self):
+        while True:
+            try:
+                job = json.loads(_recv(self.request), object_hook=_to_str)
+            except EOFError:
+                return
+            result = self.server.pool.apply(_render,
+                (job["document"], job["data"]))
+            if result[0] == "ok":
+                _send(self.request, json.dumps({"ok": True}))
+                _send(self.request, result[1])
+            else:
+                _send(self.request, json.dumps({"ok": False,
+                    "code": result[1], "args": result[2]}))
+
+
+class _UnixServer(SocketServer.ThreadingMixIn,
+        SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _send(sock, data):
+    """
+    Send length prefixed message
+    """
+    sock.sendall(struct.pack("!I", len(data)) + data)
+
+
+def _recv(sock):
+    """
+    Receive length prefixed message, raises EOFError if the connection was
+    closed
+    """
+    size = struct.unpack("!I", _recv_exactly(sock, 4))[0]
+    return _recv_exactly(sock, size)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise EOFError()
+        chunks.append(chunk)
+        size -= len(chunk)
+    return "".join(chunks)
+
+
+def _to_str(obj):
+    """
+    Convert unicode strings of decoded JSON object to utf-8 encoded strings
+    """
+    def convert(v):
+        if isinstance(v, unicode):
+            return v.encode("utf-8")
+        if isinstance(v, list):
+            return [convert(i) for i in v]
+        return v
+    return {convert(k): convert(v) for k, v in obj.items()}
+
+
+def _init_worker(fonts):
+    """
+    Initialize worker process of render server
+    """
+    warm_up(fonts)
+
+
+def _render(document, data):
+    """
+    Render document in worker process and return ("ok", pdf) or ("error",
+    code, args)
+    """
+    if document not in _documents:
+        return ("error", "UNKNOWN_DOCUMENT", (document,))
+    try:
+        return ("ok", _documents[document](data).render_to_bytes())
+    except RenderError as e:
+        return ("error", e.code, [str(a) for a in e.args])
+    except Exception as e:
+        return ("error", "UNKNOWN_ERROR", [repr(e)])
@@ -0,0 +1,101 @@
+# pyspdf - a small and simple pdf renderer based on pygtk
+# Copyright (C) 2017 Lukas Schwarz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import cPickle as pickle
+import os
+import shutil
+import tempfile
+
+class PageStore(object):
+    """
+    Temporary on-disk store of the paginated items of each page, which keeps
+    the memory usage independent of the page count. Items are pickled
+    without their pango layouts and pixbufs, i.e. texts are stored as
+    strings with their measurements and line breaks. The render context is
+    not stored but replaced by the current one when a page is loaded.
+    Layouts are re-created when the items are drawn.
+    
+    Supported items are `Text`, `TextLines`, `TextBlock`, `Labels`, `Table`,
+    `Image`, `Line` and other picklable objects
+    """
+    
+    def __init__(self, ctx, directory=None):
+        """
+        Parameters
+        ----------
+        ctx : gtk.PrintContext, RenderContext
+            Context of the stored items
+        directory : None, string
+            Parent directory of the temporary store
+        """
+        self.ctx = ctx
+        self.directory = tempfile.mkdtemp(prefix="pyspdf", dir=directory)
+        self.pages = set()
+    
+    
+    def put(self, no, items):
+        """
+        Store items of page `no`
+        
+        Parameters
+        ----------
+        no : int
+        items : mixed
+            Items of the page, e.g. a list of (item, x, y)
+        """
+        with open(self._path(no), "wb") as fh:
+            pickler = pickle.Pickler(fh, pickle.HIGHEST_PROTOCOL)
+            pickler.persistent_id = self._persistent_id
+            pickler.dump(items)
+        self.pages.add(no)
+    
+    
+    def get(self, no):
+        """
+        Load items of page `no`
+        
+        Parameters
+        ----------
+        no : int
+        """
+        with open(self._path(no), "rb") as fh:
+            unpickler = pickle.Unpickler(fh)
+            unpickler.persistent_load = self._persistent_load
+            return unpickler.load()
+    
+    
+    def close(self):
+        """
+        Remove store from disk
+        """
+        shutil.rmtree(self.directory, True)
+        self.pages = set()
+    
+    
+    def _path(self, no):
+        return os.path.join(self.directory, "{}.pickle".format(no))
+    
+    
+    def _persistent_id(self, obj):
+        if obj is self.ctx:
+            return "ctx"
+        return None
+    
+    
+    def _persistent_load(self, pid):
+        if pid == "ctx":
+            return self.ctx
+        raise pickle.UnpicklingError("Unknown persistent id {}".format(pid))
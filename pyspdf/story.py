@@ -0,0 +1,459 @@
+# pyspdf - a small and simple pdf renderer based on pygtk
+# Copyright (C) 2017 Lukas Schwarz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+from error import RenderError
+from pdf import PDF
+from text import Text, flow_lines
+from table import Table
+from image import Image
+from line import Line
+from store import PageStore
+
+class Frame(object):
+    """
+    Rectangular area of a page, which is filled with items of the story
+    """
+    __slots__ = ("x", "y", "w", "h")
+    
+    def __init__(self, x, y, w, h):
+        """
+        Parameters
+        ----------
+        x,y : float
+            Position of top left corner on the page
+        w,h : float
+            Size of frame
+        """
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+
+
+class PageTemplate(object):
+    """
+    Definition of the frames of a page and of its static content, e.g. a
+    header or page numbers
+    """
+    __slots__ = ("frames", "draw")
+    
+    def __init__(self, frames, draw=None):
+        """
+        Parameters
+        ----------
+        frames : list<Frame>
+            Frames in the order they are filled
+        draw : None, function(ctx, no)
+            Function drawing the static content of page `no`
+        """
+        self.frames = frames
+        self.draw = draw
+
+
+class Spacer(object):
+    """
+    Vertical space between items of the story. Spacers at the top of a frame
+    are dropped
+    """
+    __slots__ = ("h",)
+    
+    def __init__(self, h):
+        """
+        Parameters
+        ----------
+        h : float
+            Height of space
+        """
+        self.h = h
+
+
+class PageBreak(object):
+    """
+    Item of the story, which continues the story on a new page
+    """
+    __slots__ = ()
+
+
+class KeepTogether(object):
+    """
+    Items of the story, which are moved into the next frame together, if
+    they do not fit into the remaining height of the current frame, e.g. a
+    heading and the first paragraph
+    """
+    __slots__ = ("items",)
+    
+    def __init__(self, items):
+        """
+        Parameters
+        ----------
+        items : list
+        """
+        self.items = items
+
+
+class StoryPDF(PDF):
+    """
+    PDF document consisting of a story, a sequence of items (`Text`,
+    `Table`, `Image`, `Line`, `Spacer`, `PageBreak`, `KeepTogether`), which
+    is distributed onto the frames of page templates automatically. Texts
+    and tables are split at frame ends. The items are laid out once while
+    paginating and drawn with the same layouts.
+    
+    Derive a class and implement the method `_story()` instead of
+    `_paginate()` and `_draw_page()`
+    """
+    
+    def __init__(self, templates=None, margin=10, spacing=0,
+            repeat_header=False, out_of_core=False, **kwargs):
+        """
+        Parameters
+        ----------
+        templates : None, list<PageTemplate>
+            Template of each page. Last template will be repeated if
+            required. If None, each page consists of a single frame with the
+            given margin
+        margin : float
+            Margin of the default template
+        spacing : float
+            Vertical space between consecutive items of a frame
+        repeat_header : bool
+            Whether the header of split tables is repeated in each part
+        out_of_core : bool
+            Whether completed pages are moved into a `PageStore` on disk
+            while paginating and loaded again when they are drawn. Together
+            with a generator as story, the memory usage is independent of
+            the page count. The store is removed when the rendering is
+            finished
+        kwargs : see `PDF.__init__()`
+        """
+        PDF.__init__(self, **kwargs)
+        if templates == None:
+            w, h = self._get_page_size()
+            templates = [PageTemplate([Frame(margin, margin,
+                w - 2*margin, h - 2*margin)])]
+        self.templates = templates
+        self.spacing = spacing
+        self.repeat_header = repeat_header
+        self.out_of_core = out_of_core
+        self.store = None
+        
+        # items of each page with their absolute position
+        # format: [[(item, x, y), ...], ...]
+        self.pages = []
+        self.frame_idx = 0
+        self.cursor = 0
+    
+    
+    def save_to_file(self, filename, processes=1):
+        try:
+            PDF.save_to_file(self, filename, processes)
+        finally:
+            self.__close_store()
+    
+    
+    def show_print_dialog(self):
+        try:
+            PDF.show_print_dialog(self)
+        finally:
+            self.__close_store()
+    
+    
+    def render_png(self, pages=None, dpi=96., processes=1, paginate=True):
+        """
+        see `PDF.render_png()`. Documents with `out_of_core` are always
+        paginated again, as the page store of the previous rendering is
+        already removed
+        """
+        try:
+            return PDF.render_png(self, pages, dpi, processes,
+                paginate or self.out_of_core)
+        finally:
+            self.__close_store()
+    
+    
+    def _story(self, ctx):
+        """
+        Method is called before the rendering process starts. It has to
+        return the items of the document in order
+        
+        Parameters
+        ----------
+        ctx : gtk.PrintContext
+        """
+        raise NotImplementedError("Method `_story()` is not implemented")
+    
+    
+    def _get_template(self, no):
+        """
+        Return template of page `no`
+        
+        Parameters
+        ----------
+        no : int
+        """
+        return self.templates[min(no, len(self.templates) - 1)]
+    
+    
+    def _paginate(self, op, ctx):
+        self.__close_store()
+        self.store = PageStore(ctx) if self.out_of_core else None
+        self.pages = []
+        self.__new_page()
+        for item in self._story(ctx):
+            self.__add(item)
+        if not self.pages[-1]:
+            self.pages.pop()
+        self.__spill_page()
+        self._set_page_count(len(self.pages))
+    
+    
+    def _draw_page(self, op, ctx, no):
+        template = self._get_template(no)
+        if template.draw:
+            template.draw(ctx, no)
+        items = self.pages[no]
+        if self.store:
+            items = self.store.get(no)
+        for item, x, y in items:
+            item.draw(x, y)
+    
+    
+    def __add(self, item):
+        """
+        Add item of story at the current position
+        
+        Parameters
+        ----------
+        item : mixed
+        """
+        if isinstance(item, PageBreak):
+            if self.pages[-1]:
+                self.__new_page()
+            return
+        
+        if isinstance(item, Spacer):
+            if self.cursor == 0:
+                return
+            if item.h >= self.__frame().h - self.cursor:
+                self.__next_frame()
+            else:
+                self.cursor += item.h
+            return
+        
+        if isinstance(item, KeepTogether):
+            h = sum(_height(i) for i in item.items) + \
+                self.spacing*(len(item.items) - 1)
+            if self.cursor > 0 and self.__remaining() < h <= \
+                    self.__frame().h:
+                self.__next_frame()
+            for i in item.items:
+                self.__add(i)
+            return
+        
+        h = _height(item)
+        if h <= self.__remaining():
+            self.__place(item, h)
+        elif isinstance(item, Text):
+            self.__add_text(item)
+        elif isinstance(item, Table):
+            self.__add_table(item)
+        else:
+            if self.cursor > 0:
+                self.__next_frame()
+            self.__place(item, h)
+    
+    
+    def __add_text(self, text):
+        """
+        Distribute lines of text onto the current and the following frames
+        """
+        extents = text.get_line_extents()
+        if self.cursor > 0 and extents[0][3] > self.__remaining():
+            self.__next_frame()
+            if text.h <= self.__remaining():
+                self.__place(text, text.h)
+                return
+        
+        heights = self.__heights()
+        for i, block in enumerate(flow_lines(text.ctx, [text], heights)):
+            if i > 0:
+                self.__next_frame()
+            self.__place(block, block.h)
+    
+    
+    def __add_table(self, table):
+        """
+        Distribute rows of table onto the current and the following frames
+        """
+        if len(table.h_rows_b) and self.cursor > 0 and \
+                table.h_h + table.h_rows_b[0] > self.__remaining():
+            self.__next_frame()
+        try:
+            tables = table.split(self.__heights(), self.repeat_header)
+        except RenderError:
+            # rows are checked against the first height, a row may be higher
+            # than the remaining height but fit into a complete frame
+            if self.cursor == 0:
+                raise
+            self.__next_frame()
+            tables = table.split(self.__heights(), self.repeat_header)
+        if self.cursor > 0 and len(tables) > 1 and not tables[0].cells_b:
+            # not even the first row fits into the current frame
+            self.__next_frame()
+            tables = table.split(self.__heights(), self.repeat_header)
+        for i, part in enumerate(tables):
+            if i > 0:
+                self.__next_frame()
+            self.__place(part, part.h)
+    
+    
+    def __frame(self):
+        """
+        Return current frame
+        """
+        return self._get_template(len(self.pages) - 1).frames[self.frame_idx]
+    
+    
+    def __remaining(self):
+        """
+        Return available height of the current frame for the next item
+        """
+        gap = self.spacing if self.cursor > 0 else 0
+        return self.__frame().h - self.cursor - gap
+    
+    
+    def __heights(self):
+        """
+        Return available heights of the current and all following frames,
+        which are determined on demand
+        """
+        def following(no, idx):
+            while True:
+                idx += 1
+                if idx >= len(self._get_template(no).frames):
+                    no += 1
+                    idx = 0
+                yield self._get_template(no).frames[idx].h
+        return _Heights(self.__remaining(),
+            following(len(self.pages) - 1, self.frame_idx))
+    
+    
+    def __place(self, item, h):
+        """
+        Add item to the current frame
+        
+        Parameters
+        ----------
+        item : mixed
+        h : float
+            Height of item
+        """
+        frame = self.__frame()
+        gap = self.spacing if self.cursor > 0 else 0
+        self.pages[-1].append((item, frame.x, frame.y + self.cursor + gap))
+        self.cursor += gap + h
+    
+    
+    def __next_frame(self):
+        """
+        Continue with the next frame, which may be on a new page
+        """
+        frames = self._get_template(len(self.pages) - 1).frames
+        if self.frame_idx + 1 < len(frames):
+            self.frame_idx += 1
+            self.cursor = 0
+        else:
+            self.__new_page()
+    
+    
+    def __new_page(self):
+        """
+        Continue with the first frame of a new page
+        """
+        self.__spill_page()
+        self.pages.append([])
+        self.frame_idx = 0
+        self.cursor = 0
+
+    
+    
+    def __close_store(self):
+        """
+        Remove page store of the previous pagination from disk
+        """
+        if self.store:
+            self.store.close()
+            self.store = None
+    
+    
+    def __spill_page(self):
+        """
+        Move items of the last page into the page store
+        """
+        if self.store and self.pages and self.pages[-1] != None:
+            self.store.put(len(self.pages) - 1, self.pages[-1])
+            self.pages[-1] = None
+
+
+class _Heights(object):
+    """
+    Endless list of frame heights, which are taken from a generator when
+    they are accessed. Can be used as `max_height` of `flow_lines()` and
+    `Table.split()`
+    """
+    __slots__ = ("heights", "following")
+    
+    def __init__(self, first, following):
+        """
+        Parameters
+        ----------
+        first : float
+            Height of the current frame
+        following : generator<float>
+            Heights of the following frames
+        """
+        self.heights = [first]
+        self.following = following
+    
+    
+    def __len__(self):
+        return sys.maxsize
+    
+    
+    def __getitem__(self, i):
+        while len(self.heights) <= i:
+            self.heights.append(next(self.following))
+        return self.heights[i]
+
+
+def _height(item):
+    """
+    Return height of item of story
+    
+    Parameters
+    ----------
+    item : mixed
+    """
+    if isinstance(item, PageBreak):
+        return 0
+    if isinstance(item, Image):
+        return item.fmt.height
+    if isinstance(item, Line):
+        return max(item.dy, 0)
+    if isinstance(item, KeepTogether):
+        return sum(_height(i) for i in item.items)
+    return item.h
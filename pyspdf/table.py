@@ -15,11 +15,26 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import copy
-import gtk
+import heapq
+import multiprocessing
+import random
+from array import array
 import pango
 from error import RenderError
-from text import TextFormat, Text
+from text import TextFormat, Text, TextMetrics
 from line import LineFormat, Line
+from context import RenderContext, get_resolution, warm_up
+import tracing
+from tracing import traced
+
+def _to_str(value):
+    """
+    Return cell value as string
+    """
+    if isinstance(value, basestring):
+        return value
+    return str(value)
+
 
 class TableFormat:
     """
@@ -46,6 +61,9 @@ class TableFormat:
         self.w = None # table width if `w_type` is "fixed"
         self.w_type_col = "auto"
         self.w_col = None # column width if `w_type_col` is fixed
+        self.sample = None # body rows sampled to determine column widths
+        self.sample_n = None # size of sample
+        self.sample_overflow = "wrap" # handling of cells exceeding sample
         self.fmt_h = {col:TextFormat() for col in self.cols}
         self.fmt_b = {col:TextFormat() for col in self.cols}
         self.fmt_f = {col:TextFormat() for col in self.cols}
@@ -126,6 +144,32 @@ class TableFormat:
         self.w_col = width
     
     
+    def set_col_width_sample(self, sample, n=100, overflow="wrap"):
+        """
+        Determine the required space of the columns only from a sample of the
+        body rows instead of all rows. This affects the width types where the
+        space of all cells is required before the column widths are known
+        (table "auto" with columns "equal", table "fixed" with columns "auto")
+        
+        Parameters
+        ----------
+        sample : None, "first", "random", "longest"
+            None: all rows
+            "first": first `n` rows
+            "random": `n` randomly chosen rows
+            "longest": for each column the `n` rows with the longest values
+        n : int
+        overflow : "wrap", "expand"
+            Handling of cells, which require more space than determined from
+            the sample. Either the cell text is wrapped or the column is
+            expanded. Columns can only be expanded if the table width type is
+            "auto", otherwise cells are wrapped
+        """
+        self.sample = sample
+        self.sample_n = n
+        self.sample_overflow = overflow
+    
+    
     def set_fmt(self, fmt):
         """
         Set cell format for all cells
@@ -241,7 +285,8 @@ class Table:
     Table item
     """
     
-    def __init__(self, ctx, fmt, data_h=[], data_b=[], data_f=[]):
+    def __init__(self, ctx, fmt, data_h=[], data_b=[], data_f=[],
+            lazy=False, metrics=False, processes=None):
         """
         Parameters
         ----------
@@ -249,10 +294,27 @@ class Table:
         fmt : TableFormat
         data_h, data_b, data_f : [{col1:value1, col2:value2, ...}, ...]
             Table data (rows) of head, body and foot
+        lazy : bool
+            Whether cells are created as lazy texts, which drop their layout
+            after measuring (see `Text`)
+        metrics : bool
+            Whether the size of single line cells without markup is estimated
+            from glyph advances (see `TextMetrics`) instead of laying them
+            out. Estimated cells are lazy texts
+        processes : None, int
+            If set, cells are measured in a pool of worker processes. The
+            rows are distributed onto the workers, which measure the cells
+            with a `RenderContext` of the same resolution as `ctx`. The cells
+            are created as lazy texts from the measurements. The pool is
+            started once per table and shared by all measuring passes
         """
         self.ctx = ctx
         self.fmt = fmt
         self.cols = self.fmt.cols
+        self.lazy = lazy
+        self.metrics = metrics
+        self.processes = processes
+        self.pool = None
         
         # total width and height of table (inclusive padding)
         self.w = 0
@@ -264,12 +326,12 @@ class Table:
         self.h_f = 0
         
         # width of columns (exclusive padding)
-        self.w_cols = []
+        self.w_cols = array("d")
         
         # height of (head, body, foot) rows (exclusive padding)
-        self.h_rows_h = []
-        self.h_rows_b = []
-        self.h_rows_f = []
+        self.h_rows_h = array("d")
+        self.h_rows_b = array("d")
+        self.h_rows_f = array("d")
         
         # cells (Text objects) of (head, body, foot) parts
         # format: [[cell1, cell2, ...], ...]
@@ -277,7 +339,22 @@ class Table:
         self.cells_b = []
         self.cells_f = []
         
+        try:
+            self._layout(data_h, data_b, data_f)
+        finally:
+            # stop worker processes measuring cells
+            self._close_pool()
+    
+    
+    def _layout(self, data_h, data_b, data_f):
+        """
+        Render cells and determine column widths and part heights
         
+        Parameters
+        ----------
+        data_h, data_b, data_f : [{col1:value1, col2:value2, ...}, ...]
+            Table data (rows) of head, body and foot
+        """
         # first rendering of cells without width restriction to get required
         # space. This is needed for some table format descriptions
         self.w_cols = None # (set to None for second rendering)
@@ -286,12 +363,12 @@ class Table:
             
             # render head, body and foot cells
             w_cols_h = self._render(data_h, self.fmt.fmt_h)[1]
-            w_cols_b = self._render(data_b, self.fmt.fmt_b)[1]
+            w_cols_b = self._render(self._sample(data_b), self.fmt.fmt_b)[1]
             w_cols_f = self._render(data_f, self.fmt.fmt_f)[1]
             
             # required space of each column is the maximum out of the
             # head, body and foot columns
-            self.w_cols = []
+            self.w_cols = array("d")
             for i in range(len(self.cols)):
                 self.w_cols.append(max(w_cols_h[i], w_cols_b[i], w_cols_f[i]))
         
@@ -305,11 +382,11 @@ class Table:
             # all columns should have the same width
             # (width of the broadest column)
             if self.fmt.w_type_col == "equal":
-                self.w_cols = [max(self.w_cols)]*len(self.cols)
+                self.w_cols = array("d", [max(self.w_cols)])*len(self.cols)
             
             # all columns should have the predefined fixed width
             elif self.fmt.w_type_col == "fixed":
-                self.w_cols = [self.fmt.w_col]*len(self.cols)
+                self.w_cols = array("d", [self.fmt.w_col])*len(self.cols)
         
         # table width is fixed
         elif self.fmt.w_type == "fixed":
@@ -342,7 +419,8 @@ class Table:
             # all columns should have the same width
             # (available space is distributed equally)
             if self.fmt.w_type_col == "equal":
-                self.w_cols = [space_avail/len(self.cols)]*len(self.cols)
+                self.w_cols = array("d",
+                    [space_avail/len(self.cols)])*len(self.cols)
         
         
         # render cells with correct column widths
@@ -353,6 +431,21 @@ class Table:
         self.cells_f, w_cols_foot, self.h_rows_f = self._render(
             data_f, self.fmt.fmt_f, self.w_cols)
         
+        # expand columns if body cells require more space than determined
+        # from the sample. Only wrapped cells are laid out again with the new
+        # widths
+        if self.fmt.sample and self.fmt.sample_overflow == "expand" and \
+                self.fmt.w_type == "auto" and self.fmt.w_type_col == "equal":
+            w_cols = self._overflow(self.cells_b, self.fmt.fmt_b)
+            if w_cols != self.w_cols:
+                self.w_cols = array("d", [max(w_cols)])*len(self.cols)
+                self.cells_h, self.h_rows_h = self._widen(self.cells_h,
+                    self.fmt.fmt_h)
+                self.cells_b, self.h_rows_b = self._widen(self.cells_b,
+                    self.fmt.fmt_b)
+                self.cells_f, self.h_rows_f = self._widen(self.cells_f,
+                    self.fmt.fmt_f)
+        
         
         # calculate total table width
         self.w = self.fmt.w
@@ -409,6 +502,115 @@ class Table:
         self.h = self.h_h + self.h_b + self.h_f
     
     
+    def _sample(self, data):
+        """
+        Return sample of body rows `data` used to determine the required
+        space of the columns (see `TableFormat.set_col_width_sample()`)
+        """
+        n = self.fmt.sample_n
+        if not self.fmt.sample or len(data) <= n:
+            return data
+        if self.fmt.sample == "first":
+            return data[:n]
+        if self.fmt.sample == "random":
+            return random.sample(data, n)
+        if self.fmt.sample == "longest":
+            rows = set()
+            for col in self.cols:
+                rows.update(heapq.nlargest(n, range(len(data)),
+                    key=lambda i: len(_to_str(data[i][col]))))
+            return [data[i] for i in sorted(rows)]
+        raise ValueError("Unknown sample type '{}'".format(self.fmt.sample))
+    
+    
+    def _overflow(self, cells, fmt):
+        """
+        Return column widths required by the given rendered cells. Only cells
+        which were wrapped or exceed their column are laid out again
+        without width restriction
+        
+        Parameters
+        ----------
+        cells : [[Text, ...], ...]
+        fmt : {col:TextFormat, ...}
+        """
+        w_cols = array("d", self.w_cols)
+        for row in cells:
+            for i, cell in enumerate(row):
+                lines = _to_str(cell.text).count("\n") + 1
+                if cell.lines > lines or cell.w > w_cols[i]:
+                    fmt_col = copy.copy(fmt[self.cols[i]])
+                    fmt_col.width = None
+                    w_cols[i] = max(w_cols[i],
+                        Text(self.ctx, cell.text, fmt_col).w)
+        return w_cols
+    
+    
+    def _widen(self, cells, fmt):
+        """
+        Return cells and row heights of rendered cells for the widened
+        columns `w_cols`. Only cells which were wrapped are laid out again,
+        the other cells keep their measurements
+        
+        Parameters
+        ----------
+        cells : [[Text, ...], ...]
+        fmt : {col:TextFormat, ...}
+        """
+        fmt_cols = self._fmt_cols(fmt, self.w_cols)
+        cells_new = []
+        h_rows = array("d")
+        
+        # cells shared between rows stay shared
+        # format: {id(cell):cell, ...}
+        cell_memo = {}
+        
+        for row in cells:
+            row_new = []
+            for i, cell in enumerate(row):
+                if id(cell) not in cell_memo:
+                    lines = _to_str(cell.text).count("\n") + 1
+                    if cell.lines > lines:
+                        cell_new = Text(self.ctx, cell.text, fmt_cols[i],
+                            self.lazy)
+                    else:
+                        cell_new = Text.from_metrics(self.ctx, cell.text,
+                            fmt_cols[i], cell.w, cell.h, cell.lines)
+                        cell_new.lazy = cell.lazy
+                    cell_memo[id(cell)] = cell_new
+                row_new.append(cell_memo[id(cell)])
+            cells_new.append(row_new)
+            h_rows.append(max([c.h for c in row_new] or [0]))
+        return cells_new, h_rows
+    
+    
+    def _fmt_cols(self, fmt, w_fix):
+        """
+        Return format of each column with the column width set
+        
+        Parameters
+        ----------
+        fmt : {col:TextFormat, ...}
+        w_fix : None, [float, float, ...]
+            Predefined width of each column
+        """
+        # copy column formats to set the column width. Formats of already
+        # created cells must stay unmodified as lazy cells re-create their
+        # layout from them when drawn. Columns with equal format properties
+        # and width share the copy
+        fmt_cols = []
+        fmt_memo = {}
+        for i, col in enumerate(self.cols):
+            width = w_fix[i] if w_fix else None
+            key = fmt[col]._key()[:-1] + (width,)
+            if key not in fmt_memo:
+                fmt_memo[key] = copy.copy(fmt[col])
+                fmt_memo[key].width = width
+            fmt_cols.append(fmt_memo[key])
+        return fmt_cols
+    
+    
+    @traced("Table._render")
     def _render(self, data, fmt, w_fix=None):
         """
         Render cells of given data and format
@@ -419,14 +621,45 @@ class Table:
             Predefined width of each column
         """
         cells = [] # rendered cells (Text objects)
-        w_cols = [0]*len(self.cols) # width of each column
-        h_rows = [] # height of each row
-        for d in data:
+        w_cols = array("d", [0])*len(self.cols) # width of each column
+        h_rows = array("d") # height of each row
+        
+        fmt_cols = self._fmt_cols(fmt, w_fix)
+        
+        if self.metrics:
+            metrics = [TextMetrics.get(self.ctx, f) for f in fmt_cols]
+        
+        # measurements of worker processes
+        # format: [[(w, h, lines), ...], ...]
+        sizes = None
+        if self.processes and len(data) > 1:
+            sizes = self._measure(data, fmt_cols)
+        
+        # cells with identical value, format and width share one Text object
+        # format: {(format id, value type, value):cell, ...}
+        cell_memo = {}
+        
+        for j, d in enumerate(data):
             row = []
             h_row = 0
             for i, col in enumerate(self.cols):
-                fmt[col].width = w_fix[i] if w_fix else None
-                row.append(Text(self.ctx, d[col], fmt[col]))
+                key = (id(fmt_cols[i]), type(d[col]), d[col])
+                try:
+                    cell = cell_memo.get(key)
+                except TypeError:
+                    # unhashable value
+                    key = None
+                    cell = None
+                if cell == None:
+                    if sizes:
+                        cell = Text.from_metrics(self.ctx, d[col],
+                            fmt_cols[i], *sizes[j][i])
+                    else:
+                        cell = self._create_cell(d[col], fmt_cols[i],
+                            metrics[i] if self.metrics else None)
+                    if key:
+                        cell_memo[key] = cell
+                row.append(cell)
                 
                 # determine maximum width of column out of all rows
                 if row[i].w > w_cols[i]:
@@ -440,6 +673,67 @@ class Table:
         return cells, w_cols, h_rows
     
     
+    def _measure(self, data, fmt_cols):
+        """
+        Measure cells of given data in worker processes and return their
+        sizes [[(w, h, lines), ...], ...]
+        
+        Parameters
+        ----------
+        data : [{col1:value1, col2:value2, ...}, ...]
+        fmt_cols : [TextFormat, ...]
+            Format of each column
+        """
+        if self.pool == None:
+            # load fonts of all table parts, the pool is reused for all parts
+            fonts = {}
+            for fmt in [self.fmt.fmt_h, self.fmt.fmt_b, self.fmt.fmt_f]:
+                for f in fmt.values():
+                    fonts[f._key()[:4]] = f
+            tracing.prepare_workers()
+            self.pool = multiprocessing.Pool(self.processes, _init_worker,
+                get_resolution(self.ctx) + (fonts.values(),))
+        
+        # split rows into chunks, about 4 per process
+        rows = [[d[col] for col in self.cols] for d in data]
+        chunk = (len(rows) + 4*self.processes - 1)//(4*self.processes)
+        sizes = self.pool.map(_measure_rows, [(fmt_cols, rows[i:i+chunk])
+            for i in range(0, len(rows), chunk)])
+        return [row for rows_sizes in sizes for row in rows_sizes]
+    
+    
+    def _close_pool(self):
+        """
+        Stop worker processes measuring cells
+        """
+        if self.pool != None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+    
+    
+    def _create_cell(self, value, fmt, metrics):
+        """
+        Create cell (Text object) of given value and format
+        
+        Parameters
+        ----------
+        value : str
+        fmt : TextFormat
+        metrics : None, TextMetrics
+            Metrics used to estimate the size of the cell if possible
+        """
+        if metrics:
+            # compare in pango units like the layout does when wrapping
+            w = metrics.advance(value)
+            if w != None and (not fmt.width or
+                    w <= int(fmt.width*pango.SCALE)):
+                return Text.from_metrics(self.ctx, value, fmt,
+                    -(-w//pango.SCALE), metrics.h)
+        return Text(self.ctx, value, fmt, self.lazy)
+    
+    
+    @traced("Table.draw")
     def draw(self, x, y):
         """
         Parameters
@@ -534,6 +828,7 @@ class Table:
                 line.draw(x, y+offset_y)
     
     
+    @traced("Table.split")
     def split(self, max_height, repeat_header=False):
         """
         Split table into multiple tables in order to fit in given `max_height`
@@ -546,6 +841,9 @@ class Table:
             if required
         repeat_header, repeat_foot : bool
             Whether header should be repeated in each part
+        
+        Raises RenderError if two parts in a row can take neither body rows
+        nor the foot, as `max_height` may be endless
         """
         if isinstance(max_height, float):
             max_height = [max_height]
@@ -573,6 +871,7 @@ class Table:
         tables = []
         row_cnt = 0
         foot = False
+        stalled = 0
         while row_cnt < len(self.cells_b) or not foot:
             size_avail = max_height[i_h]
             if i_h+1 < len(max_height):
@@ -586,12 +885,12 @@ class Table:
             else:
                 table_new.cells_h = []
                 table_new.h_h = 0
-                table_new.h_rows_h = 0
+                table_new.h_rows_h = array("d")
             
             # handle body
             cells_b = []
             h_b = 0
-            h_rows_b = []
+            h_rows_b = array("d")
             for i in range(row_cnt, len(self.cells_b)):
                 h_row = self.h_rows_b[i]
                 if i != 0 or table_new.cells_h or not self.fmt.skip_pad_t:
@@ -616,10 +915,63 @@ class Table:
             if row_cnt != len(self.cells_b) or size_avail < self.h_f:
                 table_new.cells_f = []
                 table_new.h_f = 0
-                table_new.h_rows_f = 0
+                table_new.h_rows_f = array("d")
             else:
                 foot = True
             
+            # a part may only take the header, e.g. at the end of a page
+            if not cells_b and not table_new.cells_f:
+                stalled += 1
+                if stalled > 1:
+                    raise RenderError("Can not split table with header, " +
+                        "rows and foot not fitting into maximum height")
+            else:
+                stalled = 0
+            
             table_new.h = table_new.h_h + table_new.h_b + table_new.h_f
             tables.append(table_new)
         return tables
+
+
+# render context of worker processes measuring cells
+_worker_ctx = None
+
+def _init_worker(units_per_inch, dpi, fonts=()):
+    """
+    Initialize worker process measuring cells and load the fonts of the
+    column formats
+    """
+    global _worker_ctx
+    warm_up(fonts, units_per_inch)
+    _worker_ctx = RenderContext(units_per_inch, dpi)
+
+
+def _measure_rows(args):
+    """
+    Return sizes [[(w, h, lines), ...], ...] of cells of given rows, which are
+    measured in a worker process. The spans of the worker are saved after
+    each chunk, as pool workers exit without cleanup
+    
+    Parameters
+    ----------
+    args : ([TextFormat, ...], [[value1, value2, ...], ...])
+        Format of each column and rows
+    """
+    try:
+        return _measure_chunk(*args)
+    finally:
+        tracing.save_worker()
+
+
+@traced("Table._measure_rows")
+def _measure_chunk(fmt_cols, rows):
+    """
+    Return sizes [[(w, h, lines), ...], ...] of cells of given rows
+    """
+    sizes = []
+    for row in rows:
+        sizes.append([])
+        for value, fmt in zip(row, fmt_cols):
+            text = Text(_worker_ctx, value, fmt)
+            sizes[-1].append((text.w, text.h, text.lines))
+    return sizes
@@ -15,12 +15,17 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import copy
-import gtk
+import mmap
+import re
+import string
 import pango
 import gobject
 from error import RenderError
+from cache import LRUCache
+from tracing import traced
+from counters import counts
 
-class TextFormat:
+class TextFormat(object):
     """
     Definition of text format
     Parameters
@@ -37,6 +42,9 @@ class TextFormat:
     width : maximum width of text, enables text wrapping
     
     """
+    __slots__ = ("font", "size", "style", "font_descr", "line_spacing", "wrap",
+        "justify", "align", "color", "width")
+    
     def __init__(self, font="Arial", size=10, style="", font_descr=None,
             line_spacing=1, wrap=pango.WRAP_WORD, justify=False,
             align=pango.ALIGN_LEFT, color="#000000", width=None):
@@ -58,19 +66,99 @@ class TextFormat:
         """
         fmt = TextFormat()
         memo[id(self)] = fmt
-        for k, v in self.__dict__.items():
-            setattr(fmt, k, copy.deepcopy(v, memo))
+        for k in self.__slots__:
+            setattr(fmt, k, copy.deepcopy(getattr(self, k), memo))
         if self.font_descr:
             fmt.font_descr = pango.FontDescription(self.font_descr.__str__())
         return fmt
+    
+    
+    def __getstate__(self):
+        """
+        Implemented because pango.FontDescription can not be pickled
+        """
+        state = {k:getattr(self, k) for k in self.__slots__}
+        if self.font_descr:
+            state["font_descr"] = self.font_descr.__str__()
+        return state
+    
+    
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+        if self.font_descr:
+            self.font_descr = pango.FontDescription(self.font_descr)
+    
+    
+    def _key(self):
+        """
+        Return hashable tuple of all properties affecting the text layout
+        """
+        font_descr = self.font_descr.__str__() if self.font_descr else None
+        return (self.font, self.size, self.style, font_descr,
+            self.line_spacing, self.wrap, self.justify, self.align,
+            self.color, self.width)
+
+
+def _new_layout(ctx, fmt):
+    """
+    Create empty pango layout with given text format
+    
+    Parameters
+    ----------
+    ctx : gtk.PrintContext
+    fmt : TextFormat
+    """
+    font_descr = fmt.font_descr
+    if not font_descr:
+        font_descr = pango.FontDescription("{} {} {}".format(
+            fmt.font, fmt.style, fmt.size))
+    layout = ctx.create_pango_layout()
+    counts["layouts"] += 1
+    layout.set_font_description(font_descr)
+    layout.set_alignment(fmt.align)
+    layout.set_justify(fmt.justify)
+    layout.set_spacing(fmt.line_spacing*pango.SCALE)
+    layout.set_wrap(fmt.wrap)
+    if fmt.width:
+        layout.set_width(int(fmt.width*pango.SCALE))
+    return layout
 
 
-class Text:
+def _set_markup(layout, fmt, text):
+    """
+    Set text of layout, which can be formatted with the Pango markup language
+    
+    Parameters
+    ----------
+    layout : pango.Layout
+    fmt : TextFormat
+    text : str
+    """
+    markup = '<span foreground="{}">{}</span>'.format(fmt.color, text)
+    try:
+        counts["markup_parses"] += 1
+        attrs, markup_text, accel = pango.parse_markup(markup)
+        layout.set_attributes(attrs)
+        layout.set_text(markup_text)
+    except Exception as e:
+        raise RenderError("PANGO_MARKUP_PARSE_ERROR", e.args[0], 
+            gobject.markup_escape_text(text))
+
+
+class Text(object):
     """
     Text item
     """
+    __slots__ = ("ctx", "fmt", "text", "lazy", "w", "h", "lines",
+        "line_breaks", "line_extents", "layout")
+    
+    # layouts of lazy texts re-created for drawing. Set to `LRUCache(0)` to
+    # disable caching
+    layout_cache = LRUCache(32)
     
-    def __init__(self, ctx, text, fmt):
+    @traced("Text.layout")
+    def __init__(self, ctx, text, fmt, lazy=False):
         """
         Parameters
         ----------
@@ -79,36 +167,141 @@ class Text:
         text : str
                text can be formatted with the Pango markup language, see
                https://developer.gnome.org/pango/stable/PangoMarkupFormat.html
+        lazy : bool
+               If true, only the measurements (`w`, `h`, `lines`,
+               `line_breaks` and `line_extents`) are kept and the layout is
+               dropped. It is
+               re-created on demand when the text is drawn. The format `fmt`
+               must not be modified afterwards
         """
         self.ctx = ctx
         self.fmt = fmt
         self.text = text
+        self.lazy = lazy
         
-        font_descr = self.fmt.font_descr
-        if not font_descr:
-            font_descr = pango.FontDescription("{} {} {}".format(
-                self.fmt.font, self.fmt.style, self.fmt.size))
-        self.layout = ctx.create_pango_layout()
-        self.layout.set_font_description(font_descr)
-        self.layout.set_alignment(self.fmt.align)
-        self.layout.set_justify(self.fmt.justify)
-        self.layout.set_spacing(self.fmt.line_spacing*pango.SCALE)
-        self.layout.set_wrap(self.fmt.wrap)
-        text = '<span foreground="{}">{}</span>'.format(self.fmt.color,
-            self.text)
-        if self.fmt.width:
-            self.layout.set_width(int(self.fmt.width*pango.SCALE))
-        try:
-            attrs, markup_text, accel = pango.parse_markup(text)
-            self.layout.set_attributes(attrs)
-            self.layout.set_text(markup_text)
-        except Exception as e:
-            raise RenderError("PANGO_MARKUP_PARSE_ERROR", e.args[0], 
-                gobject.markup_escape_text(self.text))
-        
-        self.w = self.layout.get_pixel_size()[0]
-        self.h = self.layout.get_pixel_size()[1]
-        self.lines = self.layout.get_line_count()
+        layout = self._create_layout()
+        self.w = layout.get_pixel_size()[0]
+        self.h = layout.get_pixel_size()[1]
+        self.lines = layout.get_line_count()
+        
+        self.line_breaks = None
+        self.line_extents = None
+        if self.lazy:
+            self._measure_lines(layout)
+            self.layout = None
+        else:
+            self.layout = layout
+    
+    
+    @classmethod
+    def from_metrics(cls, ctx, text, fmt, w, h, lines=1):
+        """
+        Create lazy text from already known measurements without laying it
+        out. The layout is created when the text is drawn
+        
+        Parameters
+        ----------
+        ctx : gtk.PrintContext
+        text : str
+        fmt : TextFormat
+        w, h : float
+            Size of text
+        lines : int
+            Number of lines
+        """
+        obj = cls.__new__(cls)
+        obj.ctx = ctx
+        obj.fmt = fmt
+        obj.text = text
+        obj.lazy = True
+        obj.w = w
+        obj.h = h
+        obj.lines = lines
+        obj.line_breaks = None
+        obj.line_extents = None
+        obj.layout = None
+        return obj
+    
+    
+    def __getstate__(self):
+        """
+        Implemented because pango.Layout can not be pickled. The layout is
+        re-created when the text is drawn
+        """
+        state = {k:getattr(self, k) for k in self.__slots__}
+        state["layout"] = None
+        return state
+    
+    
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+    
+    
+    def __copy__(self):
+        """
+        Implemented because `__getstate__()` drops the layout, copies share
+        the layout instead
+        """
+        obj = self.__class__.__new__(self.__class__)
+        for k in self.__slots__:
+            setattr(obj, k, getattr(self, k))
+        return obj
+    
+    
+    def _measure_lines(self, layout):
+        """
+        Determine byte offset of the first character (`line_breaks`) and
+        logical extents (`line_extents`) of each line of the layout
+        """
+        self.line_breaks = []
+        self.line_extents = []
+        it = layout.get_iter()
+        while True:
+            self.line_breaks.append(it.get_index())
+            x, y, w, h = it.get_line_extents()[1]
+            self.line_extents.append((float(x)/pango.SCALE,
+                float(y)/pango.SCALE, float(w)/pango.SCALE,
+                float(h)/pango.SCALE, float(it.get_baseline())/pango.SCALE))
+            if not it.next_line():
+                break
+    
+    
+    def _create_layout(self):
+        """
+        Create pango layout of text
+        """
+        layout = _new_layout(self.ctx, self.fmt)
+        _set_markup(layout, self.fmt, self.text)
+        return layout
+    
+    
+    def get_layout(self):
+        """
+        Return pango layout of text. If the layout was dropped, e.g. for lazy
+        texts, it is re-created or taken from `Text.layout_cache`. Texts,
+        which are not lazy, keep the re-created layout
+        """
+        if self.layout != None:
+            return self.layout
+        key = (self.ctx, self.text, self.fmt._key())
+        layout = self.layout_cache.get(key)
+        if layout == None:
+            layout = self._create_layout()
+            self.layout_cache.put(key, layout)
+        if not self.lazy:
+            self.layout = layout
+        return layout
+    
+    
+    def get_line_extents(self):
+        """
+        Return logical extents (x, y, w, h, baseline) of each line relative to
+        the top left corner of the text
+        """
+        if self.line_extents == None:
+            self._measure_lines(self.get_layout())
+        return self.line_extents
     
     
     def draw(self, x, y):
@@ -120,9 +313,10 @@ class Text:
         """
         cctx = self.ctx.get_cairo_context()
         cctx.move_to(x, y)
-        cctx.show_layout(self.layout)
+        cctx.show_layout(self.get_layout())
     
     
+    @traced("Text.split")
     def split(self, max_height):
         """
         Split text into multiple texts in order to fit in given `max_height`
@@ -178,7 +372,8 @@ class Text:
                         i_w2 -= 1
                     i_w = i_w2
                 
-            text_new = Text(self.ctx, " ".join(words[:i_w]), self.fmt)
+            text_new = Text(self.ctx, " ".join(words[:i_w]), self.fmt,
+                self.lazy)
             texts.append(text_new)
             words = words[i_w:]
             if i_h+1 < len(max_height):
@@ -186,3 +381,717 @@ class Text:
         
         return texts
         
+    
+    
+    def flow(self, max_height, cache=None):
+        """
+        Split text into paragraphs at newlines and distribute the lines of the
+        paragraphs onto multiple blocks in order to fit in given `max_height`.
+        
+        In contrast to `Text.split()`, each paragraph is laid out only once
+        and a paragraph is only broken if it does not fit into the remaining
+        height of a block. Markup must not span multiple paragraphs
+        
+        Parameters
+        ----------
+        max_height : float, list<float>
+            Maximum height of blocks. Can be a list of heights, so different 
+            blocks can have different sizes. Last height will be repeated
+            if required
+        cache : None, LRUCache
+            Cache of laid out paragraphs. Unchanged paragraphs are taken from
+            the cache when the text is flowed again, e.g. when a document is
+            re-rendered after an edit. Cached paragraphs are drawn with the
+            context of this text
+        
+        Returns
+        -------
+        list<TextBlock>
+        """
+        if isinstance(max_height, (int, float)):
+            max_height = [max_height]
+        paragraphs = (self._paragraph(p, cache) for p in self.text.split("\n"))
+        return list(flow_lines(self.ctx, paragraphs, max_height,
+            self.fmt.line_spacing))
+    
+    
+    def flow_columns(self, col_width, col_count, max_height, gap=0):
+        """
+        Distribute text onto multiple columns and pages (newspaper layout).
+        The text is laid out only once with the column width and its lines
+        are filled into the columns of each page one after another
+        
+        Parameters
+        ----------
+        col_width : float
+            Width of each column
+        col_count : int
+            Number of columns per page
+        max_height : float, list<float>
+            Height of the columns of each page. Can be a list of heights, so
+            different pages can have different sizes. Last height will be
+            repeated if required
+        gap : float
+            Horizontal space between columns
+        
+        Returns
+        -------
+        list<TextBlock>
+            One block per page. The parts of the block are the columns with
+            their position relative to the page frame
+        """
+        if isinstance(max_height, (int, float)):
+            max_height = [max_height]
+        
+        text = self
+        if self.fmt.width != col_width:
+            fmt = copy.copy(self.fmt)
+            fmt.width = col_width
+            text = Text(self.ctx, self.text, fmt, self.lazy)
+        
+        # each page provides `col_count` frames of the same height
+        heights = [h for h in max_height for i in range(col_count)]
+        
+        pages = []
+        for i, column in enumerate(flow_lines(self.ctx, [text], heights)):
+            if i % col_count == 0:
+                pages.append(TextBlock())
+            pages[-1].add(column, (i % col_count)*(col_width+gap), 0)
+        return pages
+    
+    
+    def _paragraph(self, text, cache):
+        """
+        Return laid out paragraph `text` with format of this text
+        
+        Parameters
+        ----------
+        text : str
+        cache : None, LRUCache
+        """
+        if cache == None:
+            return Text(self.ctx, text, self.fmt, self.lazy)
+        key = (text, self.fmt._key())
+        paragraph = cache.get(key)
+        if paragraph == None:
+            paragraph = Text(self.ctx, text, self.fmt, self.lazy)
+            cache.put(key, paragraph)
+        elif paragraph.ctx is not self.ctx:
+            # paragraph of a previous rendering, draw a copy with the context
+            # of this rendering. The layout is re-created on demand
+            paragraph = copy.copy(paragraph)
+            paragraph.ctx = self.ctx
+            paragraph.layout = None
+            cache.put(key, paragraph)
+        return paragraph
+
+
+class TextMetrics(object):
+    """
+    Fast size estimation of single line texts without markup from the glyph
+    advances of their characters. The advance of each character is measured
+    once per format. Kerning and ligatures are ignored, so the estimated
+    width may differ slightly from the width of the laid out text
+    """
+    __slots__ = ("layout", "advances", "h", "h_units")
+    
+    # metrics of already used formats
+    cache = LRUCache(64)
+    
+    def __init__(self, ctx, fmt):
+        """
+        Parameters
+        ----------
+        ctx : gtk.PrintContext
+        fmt : TextFormat
+            Width of format is ignored
+        """
+        fmt = copy.copy(fmt)
+        fmt.width = None
+        self.layout = _new_layout(ctx, fmt)
+        
+        # advance of each character in pango units, None if the character
+        # changes the line height (e.g. due to a fallback font)
+        self.advances = {}
+        
+        self.layout.set_text("0")
+        self.h = self.layout.get_pixel_size()[1]
+        self.h_units = self.layout.get_size()[1]
+    
+    
+    @classmethod
+    def get(cls, ctx, fmt):
+        """
+        Return cached metrics of given format
+        
+        Parameters
+        ----------
+        ctx : gtk.PrintContext
+        fmt : TextFormat
+        """
+        key = (ctx, fmt._key()[:-1])
+        metrics = cls.cache.get(key)
+        if metrics == None:
+            metrics = cls(ctx, fmt)
+            cls.cache.put(key, metrics)
+        return metrics
+    
+    
+    def estimate(self, text):
+        """
+        Return estimated size (w, h) of single line `text` or None if the
+        text contains markup, line breaks or characters which are not
+        covered by the fast estimation. The width is rounded up like the
+        width of laid out texts
+        
+        Parameters
+        ----------
+        text : str
+        """
+        w = self.advance(text)
+        if w == None:
+            return None
+        return -(-w//pango.SCALE), self.h
+    
+    
+    def advance(self, text):
+        """
+        Return estimated width of single line `text` in pango units or None,
+        see `estimate()`
+        
+        Parameters
+        ----------
+        text : str
+        """
+        if not isinstance(text, basestring):
+            text = str(text)
+        w = 0
+        for c in text:
+            if c not in self.advances:
+                self.advances[c] = self._measure(c)
+            if self.advances[c] == None:
+                return None
+            w += self.advances[c]
+        return w
+    
+    
+    def _measure(self, c):
+        """
+        Return advance of character `c` in pango units or None if it can not
+        be used for the fast estimation
+        """
+        if c in "<&" or ord(c) < 32 or ord(c) > 126:
+            return None
+        self.layout.set_text(c)
+        w, h = self.layout.get_size()
+        if h != self.h_units:
+            return None
+        return w
+
+
+class Labels(object):
+    """
+    Text item drawing many short texts of the same format, e.g. address
+    labels. All texts are drawn with a single pooled layout, of which only
+    the text is replaced. Texts without markup are set without parsing
+    """
+    __slots__ = ("ctx", "fmt", "labels", "layout")
+    
+    def __init__(self, ctx, labels, fmt):
+        """
+        Parameters
+        ----------
+        ctx : gtk.PrintContext
+        labels : iterable<(str, float, float)>
+            Texts with their position relative to the render position
+        fmt : TextFormat
+        """
+        self.ctx = ctx
+        self.fmt = fmt
+        self.labels = labels
+        self.layout = _new_layout(self.ctx, self.fmt)
+    
+    
+    def __getstate__(self):
+        """
+        Implemented because pango.Layout can not be pickled
+        """
+        return {"ctx": self.ctx, "fmt": self.fmt, "labels": self.labels}
+    
+    
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+        self.layout = _new_layout(self.ctx, self.fmt)
+    
+    
+    def draw(self, x=0, y=0):
+        """
+        Parameters
+        ----------
+        x,y : float
+            Absolute render position of labels
+        """
+        cctx = self.ctx.get_cairo_context()
+        cctx.save()
+        counts["saves"] += 1
+        
+        # plain texts are drawn in the cairo source color instead of a
+        # foreground attribute
+        color = pango.Color(self.fmt.color)
+        cctx.set_source_rgb(color.red/65535., color.green/65535.,
+            color.blue/65535.)
+        
+        plain_attrs = pango.AttrList()
+        plain = False
+        for text, dx, dy in self.labels:
+            if not isinstance(text, basestring):
+                text = str(text)
+            if "<" in text or "&" in text:
+                _set_markup(self.layout, self.fmt, text)
+                plain = False
+            else:
+                if not plain:
+                    self.layout.set_attributes(plain_attrs)
+                    plain = True
+                self.layout.set_text(text)
+            cctx.move_to(x+dx, y+dy)
+            cctx.show_layout(self.layout)
+        cctx.restore()
+
+
+class DeferredText(object):
+    """
+    Placeholder of a text, whose value is only known when the document is
+    finished, e.g. the total page count. Drawing it reserves its position,
+    the text is drawn when all pages are drawn. Requires deferred drawing
+    (see `PDF.set_deferred_drawing()`)
+    """
+    __slots__ = ("ctx", "template", "fmt", "w", "h")
+    
+    def __init__(self, ctx, template, fmt, sample=None):
+        """
+        Parameters
+        ----------
+        ctx : RenderContext
+        template : str
+            Text with named placeholders, e.g. "Page {page} of {pages}".
+            Available values are `page`, `pages` and values set via
+            `PDF._set_deferred_value()`
+        fmt : TextFormat
+            The box of the text can be fixed via `fmt.width` and `fmt.align`
+        sample : None, str
+            Text used to measure the reserved size `w`, `h`. If None, all
+            placeholders of the template are replaced by the number 888 or
+            else the string "888", fields which accept neither require a
+            sample
+        """
+        self.ctx = ctx
+        self.template = template
+        self.fmt = fmt
+        
+        # first part of each field name, e.g. "page" of "{page:>3}"
+        names = set()
+        for literal, name, spec, conv in string.Formatter().parse(template):
+            if name == None:
+                continue
+            name = name.split(".")[0].split("[")[0]
+            if name == "" or name.isdigit():
+                raise ValueError("Placeholders of deferred texts must be " +
+                    "named, e.g. '{page}' instead of '{}'")
+            names.add(name)
+        for value in [888, "888"]:
+            if sample != None:
+                break
+            try:
+                sample = template.format(**{name: value for name in names})
+            except (ValueError, TypeError, AttributeError, KeyError,
+                    IndexError):
+                pass
+        if sample == None:
+            raise ValueError("Sample of deferred text '{}' ".format(template) +
+                "is required to measure its size")
+        text = Text(ctx, sample, fmt, True)
+        self.w = text.w
+        self.h = text.h
+    
+    
+    def draw(self, x, y):
+        """
+        Reserve position of text
+        
+        Parameters
+        ----------
+        x,y : float
+            Absolute position to draw text
+        """
+        deferred = getattr(self.ctx, "deferred", None)
+        if deferred == None:
+            raise RenderError("DEFERRED_DRAWING_DISABLED")
+        deferred.append((self, x, y))
+    
+    
+    def resolve(self, values):
+        """
+        Return text with placeholders replaced by given values
+        
+        Parameters
+        ----------
+        values : dict
+        """
+        return Text(self.ctx, self.template.format(**values), self.fmt)
+
+
+class TextLines(object):
+    """
+    Text item consisting of a range of lines of a laid out text. The lines are
+    drawn from the layout of the text without laying it out again
+    """
+    __slots__ = ("ctx", "text", "start", "end", "w", "h")
+    
+    def __init__(self, ctx, text, start, end):
+        """
+        Parameters
+        ----------
+        ctx : gtk.PrintContext
+        text : Text
+        start, end : int
+            Range of lines [start, end) of `text`
+        """
+        self.ctx = ctx
+        self.text = text
+        self.start = start
+        self.end = end
+        
+        extents = self.text.get_line_extents()
+        self.w = max(e[0]+e[2] for e in extents[start:end])
+        self.h = extents[end-1][1] + extents[end-1][3] - extents[start][1]
+    
+    
+    def draw(self, x, y):
+        """
+        Parameters
+        ----------
+        x,y : float
+            Absolute position to draw lines
+        """
+        cctx = self.ctx.get_cairo_context()
+        layout = self.text.get_layout()
+        extents = self.text.get_line_extents()
+        y -= extents[self.start][1]
+        for i in range(self.start, self.end):
+            cctx.move_to(x + extents[i][0], y + extents[i][4])
+            cctx.show_layout_line(layout.get_line(i))
+
+
+class TextBlock(object):
+    """
+    Text item consisting of multiple text items at fixed positions
+    """
+    __slots__ = ("parts", "w", "h")
+    
+    def __init__(self):
+        # text items with their position relative to the block
+        # format: [(item, x, y), ...]
+        self.parts = []
+        self.w = 0
+        self.h = 0
+    
+    
+    def add(self, item, x, y):
+        """
+        Add text item at position `x`, `y` relative to the block
+        
+        Parameters
+        ----------
+        item : Text, TextLines, TextBlock
+        x,y : float
+        """
+        self.parts.append((item, x, y))
+        self.w = max(self.w, x + item.w)
+        self.h = max(self.h, y + item.h)
+    
+    
+    def draw(self, x, y):
+        """
+        Parameters
+        ----------
+        x,y : float
+            Absolute position to draw block
+        """
+        for item, dx, dy in self.parts:
+            item.draw(x+dx, y+dy)
+
+
+class TextStream(object):
+    """
+    Text read incrementally from a file, mmap or iterator of chunks, e.g. a
+    large log file. The text is split into paragraphs at newlines, which
+    are laid out one after another while the pages are generated, so only
+    the paragraphs of the current page are kept in memory.
+    
+    Paragraphs longer than `chunk_size` are broken into pieces, each piece
+    ends with a forced line break. The pieces of a paragraph follow each
+    other without spacing, markup tags open at a break are closed at the end
+    of the piece and reopened in the next one
+    """
+    __slots__ = ("ctx", "source", "fmt", "markup", "chunk_size")
+    
+    def __init__(self, ctx, source, fmt, markup=False, chunk_size=64*1024):
+        """
+        Parameters
+        ----------
+        ctx : gtk.PrintContext
+        source : str, file object, mmap.mmap, iterable<str>
+            Filename, opened file, memory map or iterable of chunks of the
+            text. A str is interpreted as filename
+        fmt : TextFormat
+            Format of text, `fmt.width` sets the width of the pages
+        markup : bool
+            Whether the text is formatted with the Pango markup language. If
+            False, the text is escaped
+        chunk_size : int
+            Size of chunks read from files. Paragraphs longer than this size
+            are broken at a space outside of markup tags and entities
+        """
+        self.ctx = ctx
+        self.source = source
+        self.fmt = fmt
+        self.markup = markup
+        self.chunk_size = chunk_size
+    
+    
+    def flow(self, max_height, spacing=0):
+        """
+        Lay out paragraphs and distribute their lines onto blocks, see
+        `flow_lines()`
+        
+        Parameters
+        ----------
+        max_height : float, list<float>
+            Maximum height of blocks. Last height will be repeated if
+            required
+        spacing : float
+            Vertical space between paragraphs, the pieces of a broken
+            paragraph are not spaced
+        
+        Returns
+        -------
+        generator<TextBlock>
+        """
+        if isinstance(max_height, (int, float)):
+            max_height = [max_height]
+        texts = ((self._text(piece), 0 if continued else spacing)
+            for piece, continued in self._pieces())
+        return flow_lines(self.ctx, texts, max_height, spacing)
+    
+    
+    def texts(self):
+        """
+        Return generator of laid out paragraphs
+        """
+        for piece, continued in self._pieces():
+            yield self._text(piece)
+    
+    
+    def paragraphs(self):
+        """
+        Return generator of paragraphs of the text, long paragraphs are
+        broken into pieces
+        """
+        for piece, continued in self._pieces():
+            yield piece
+    
+    
+    def _text(self, piece):
+        """
+        Return laid out text of given piece of a paragraph
+        """
+        if not self.markup:
+            piece = gobject.markup_escape_text(piece)
+        return Text(self.ctx, piece, self.fmt)
+    
+    
+    def _pieces(self):
+        """
+        Return generator of (piece, continued) of the paragraphs of the text,
+        `continued` is True for all but the first piece of a paragraph
+        """
+        pieces = self._split()
+        if not self.markup:
+            return pieces
+        return _balance_tags(pieces)
+    
+    
+    def _split(self):
+        """
+        Return generator of (piece, continued) split at newlines and at the
+        breaks of long paragraphs
+        """
+        rest = ""
+        continued = False
+        for chunk in self._chunks():
+            lines = (rest + chunk).split("\n")
+            rest = lines.pop()
+            for line in lines:
+                yield line.rstrip("\r"), continued
+                continued = False
+            
+            while len(rest) > self.chunk_size:
+                end = self._break(rest)
+                yield rest[:end], continued
+                rest = rest[end:]
+                continued = True
+        if rest:
+            yield rest.rstrip("\r"), continued
+    
+    
+    def _break(self, text):
+        """
+        Return position to break given long paragraph, after a space or else
+        at a character boundary of utf-8 encoded byte strings, but never
+        inside of markup tags and entities
+        """
+        end = self.chunk_size
+        while True:
+            space = text.rfind(" ", 0, end) + 1
+            if space <= 0:
+                break
+            if not self._inside_markup(text, space):
+                return space
+            end = space - 1
+        
+        end = self.chunk_size
+        if self._inside_markup(text, end):
+            end = max(text.rfind("<", 0, end), text.rfind("&", 0, end))
+            if end <= 0:
+                # tag or entity longer than the chunk size
+                end = text.find(">" if text[0] == "<" else ";") + 1
+                return end if end > 0 else len(text)
+            return end
+        if isinstance(text, str):
+            while end > 0 and 0x80 <= ord(text[end]) < 0xc0:
+                end -= 1
+            if end == 0:
+                end = self.chunk_size
+        return end
+    
+    
+    def _inside_markup(self, text, pos):
+        """
+        Return whether given position is inside of a markup tag or entity
+        """
+        return self.markup and (
+            text.rfind("<", 0, pos) > text.rfind(">", 0, pos) or
+            text.rfind("&", 0, pos) > text.rfind(";", 0, pos))
+    
+    
+    def _chunks(self):
+        """
+        Return generator of chunks of the source
+        """
+        source = self.source
+        if isinstance(source, basestring):
+            with open(source, "rb") as fh:
+                for chunk in iter(lambda: fh.read(self.chunk_size), ""):
+                    yield chunk
+        elif isinstance(source, mmap.mmap):
+            for i in xrange(0, len(source), self.chunk_size):
+                yield source[i:i+self.chunk_size]
+        elif hasattr(source, "read"):
+            for chunk in iter(lambda: source.read(self.chunk_size), ""):
+                yield chunk
+        else:
+            for chunk in source:
+                yield chunk
+
+
+# opening or closing markup tag, e.g. <span weight="bold"> or </b>
+_TAG = re.compile(r"<(/?)([A-Za-z]+)[^>]*?(/?)>")
+
+def _balance_tags(pieces):
+    """
+    Close markup tags open at the end of each piece and reopen them at the
+    start of the next piece, so each piece can be parsed on its own
+    
+    Parameters
+    ----------
+    pieces : iterable<(str, bool)>
+    """
+    opened = []
+    for piece, continued in pieces:
+        prefix = "".join(tag for tag, name in opened)
+        for match in _TAG.finditer(piece):
+            if match.group(3):
+                continue
+            if match.group(1):
+                if opened:
+                    opened.pop()
+            else:
+                opened.append((match.group(0), match.group(2)))
+        suffix = "".join("</{}>".format(name) for tag, name in
+            reversed(opened))
+        yield prefix + piece + suffix, continued
+
+
+def flow_lines(ctx, texts, max_height, spacing=0):
+    """
+    Distribute the lines of laid out texts onto blocks fitting in given
+    `max_height`. Texts are only broken between lines if they do not fit
+    into the remaining height of a block. Blocks are generated one after
+    another, so `texts` may be a lazy iterable
+    
+    Parameters
+    ----------
+    ctx : gtk.PrintContext
+    texts : iterable<Text, (Text, float)>
+        Texts, optionally paired with the space before the text, which
+        replaces `spacing`
+    max_height : list<float>
+        Maximum height of blocks. Last height will be repeated if required
+    spacing : float
+        Vertical space between consecutive texts inside a block
+    
+    Returns
+    -------
+    generator<TextBlock>
+    """
+    i_h = 0
+    block = TextBlock()
+    size_avail = max_height[i_h]
+    for text in texts:
+        text_spacing = spacing
+        if isinstance(text, tuple):
+            text, text_spacing = text
+        extents = text.get_line_extents()
+        start = 0
+        while start < len(extents):
+            gap = text_spacing if block.parts else 0
+            top = extents[start][1]
+            
+            # add lines until the remaining height is exceeded
+            end = start
+            while end < len(extents) and \
+                    gap + extents[end][1]+extents[end][3]-top <= size_avail:
+                end += 1
+            
+            # a single line higher than a complete block is added anyway
+            if end == start and not block.parts:
+                end = start+1
+            
+            if end > start:
+                lines = TextLines(ctx, text, start, end)
+                block.add(lines, 0, block.h + gap)
+                size_avail -= gap + lines.h
+                start = end
+            
+            # block is full -> continue with next block
+            if start < len(extents):
+                yield block
+                block = TextBlock()
+                if i_h+1 < len(max_height):
+                    i_h += 1
+                size_avail = max_height[i_h]
+    
+    if block.parts:
+        yield block
@@ -0,0 +1,217 @@
+# pyspdf - a small and simple pdf renderer based on pygtk
+# Copyright (C) 2017 Lukas Schwarz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import functools
+import json
+import os
+import shutil
+import tempfile
+import time
+
+# active tracer, None if tracing is disabled
+_tracer = None
+
+class Tracer(object):
+    """
+    Recorder of render operations, which can be saved in the Chrome
+    trace-event format and viewed with Perfetto or chrome://tracing. Spans
+    recorded in forked worker processes are collected via files in a
+    temporary directory, which is created before the first workers are
+    forked (see `prepare_workers()`) and removed by `save()`
+    """
+    
+    def __init__(self):
+        self.events = []
+        self.directory = None
+    
+    
+    def span(self, name, **args):
+        """
+        Return context manager recording a span
+        
+        Parameters
+        ----------
+        name : string
+        args : additional information shown with the span
+        """
+        return _Span(self, name, args)
+    
+    
+    def add(self, name, start, end, args):
+        """
+        Add span
+        
+        Parameters
+        ----------
+        name : string
+        start,end : float
+            Time in seconds since the epoch
+        args : dict
+        """
+        pid = os.getpid()
+        self.events.append({"name": name, "cat": "pyspdf", "ph": "X",
+            "ts": start*1e6, "dur": (end - start)*1e6, "pid": pid,
+            "tid": pid, "args": args})
+    
+    
+    def prepare_workers(self):
+        """
+        Create directory receiving the spans of worker processes. Has to be
+        called in the main process before workers are forked
+        """
+        if self.directory == None:
+            self.directory = tempfile.mkdtemp(prefix="pyspdf-trace")
+    
+    
+    def save_worker(self):
+        """
+        Save spans of the current worker process, they are included by
+        `save()` of the main process
+        """
+        if self.directory == None:
+            return
+        pid = os.getpid()
+        with open(os.path.join(self.directory, "{}.json".format(pid)),
+                "w") as fh:
+            json.dump([e for e in self.events if e["pid"] == pid], fh)
+    
+    
+    def save(self, filename):
+        """
+        Save all spans including those of worker processes as trace-event
+        JSON file
+        
+        Parameters
+        ----------
+        filename : string
+        """
+        if self.directory != None:
+            for name in sorted(os.listdir(self.directory)):
+                with open(os.path.join(self.directory, name)) as fh:
+                    self.events.extend(json.load(fh))
+            shutil.rmtree(self.directory)
+            self.directory = None
+        with open(filename, "w") as fh:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"},
+                fh)
+
+
+class _Span(object):
+    """
+    Context manager recording the time of its block
+    """
+    __slots__ = ("tracer", "name", "args", "start")
+    
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = None
+    
+    
+    def __enter__(self):
+        self.start = time.time()
+        return self
+    
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        self.tracer.add(self.name, self.start, time.time(), self.args)
+        return False
+
+
+class _NullSpan(object):
+    """
+    Context manager doing nothing, used if tracing is disabled
+    """
+    
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+_null_span = _NullSpan()
+
+
+def start_trace():
+    """
+    Enable tracing and return new active tracer
+    """
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_trace():
+    """
+    Disable tracing and return the previously active tracer
+    """
+    global _tracer
+    tracer = _tracer
+    _tracer = None
+    return tracer
+
+
+def span(name, **args):
+    """
+    Return context manager recording a span with the active tracer
+    
+    Parameters
+    ----------
+    name : string
+    args : additional information shown with the span
+    """
+    if not _tracer:
+        return _null_span
+    return _tracer.span(name, **args)
+
+
+def prepare_workers():
+    """
+    Prepare collecting spans of worker processes if tracing is enabled, see
+    `Tracer.prepare_workers()`
+    """
+    if _tracer:
+        _tracer.prepare_workers()
+
+
+def save_worker():
+    """
+    Save spans of the current worker process if tracing is enabled
+    """
+    if _tracer:
+        _tracer.save_worker()
+
+
+def traced(name):
+    """
+    Decorator recording each call of a function as span with the active
+    tracer. If tracing is disabled, only a global is checked
+    
+    Parameters
+    ----------
+    name : string
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _tracer:
+                return func(*args, **kwargs)
+            with _tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
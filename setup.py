@@ -24,5 +24,9 @@ setup(
         "Programming Language :: Python :: 2.7"
     ],
     packages=["pyspdf"],
+    extras_require={
+        "merge": ["PyPDF2"],
+        "numpy": ["numpy"],
+    },
 )
 